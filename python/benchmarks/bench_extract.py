@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 The PsiZ Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Benchmark of extraction against a synthetic SQLite database.
+
+For every requested trial count, a synthetic database is generated
+(see `synthetic.py`) and the following are timed:
+    * `extract.fetch_assignment`
+    * `extract.assemble_accepted_obs`
+    * `extract.extract_observations` (end-to-end, including the
+      per-stage statistics of the returned report)
+    * `extract.summarize_observations` (database-side aggregates)
+
+Grading updates the status codes in the database, so every
+measurement runs against a fresh copy of the generated database. The
+project directory of `extract_observations` is created inside a
+temporary home directory.
+
+Results are printed and written as JSON, e.g.,
+
+```
+python bench_extract.py --n_trial 1000 100000 1000000 --fp_out bench.json
+```
+
+"""
+
+import argparse
+import json
+import os
+from pathlib import Path
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+import psizcollect.connection as pzc_connection
+import psizcollect.extract as pzc_extract
+
+import synthetic
+
+PROJECT_ID = 'bench'
+
+
+def time_fetch_assignment(fp_db, n_repeat):
+    """Time `fetch_assignment`."""
+    pzc_connection.set_backend(pzc_connection.sqlite_backend(fp_db))
+    duration = []
+    for _ in range(n_repeat):
+        my_cxn = pzc_connection.get_connection()
+        time_start = time.perf_counter()
+        df_assignment = pzc_extract.fetch_assignment(my_cxn, PROJECT_ID)
+        duration.append(time.perf_counter() - time_start)
+        my_cxn.close()
+    return {
+        'duration_s': duration,
+        'n_assignment': len(df_assignment.index)
+    }
+
+
+def time_assemble_accepted_obs(fp_db, fp_tmp, n_repeat, grade_mode):
+    """Time `assemble_accepted_obs` on fresh database copies."""
+    duration = []
+    for _ in range(n_repeat):
+        shutil.copyfile(fp_db, fp_tmp)
+        pzc_connection.set_backend(pzc_connection.sqlite_backend(fp_tmp))
+        my_cxn = pzc_connection.get_connection()
+        df_assignment = pzc_extract.fetch_assignment(my_cxn, PROJECT_ID)
+        df_assignment = df_assignment[df_assignment['status_code'] < 2]
+        stats = pzc_extract.init_stats()
+        time_start = time.perf_counter()
+        obs, _, _ = pzc_extract.assemble_accepted_obs(
+            my_cxn, df_assignment, grade_mode, .8, agent_index={},
+            stats=stats
+        )
+        duration.append(time.perf_counter() - time_start)
+        my_cxn.close()
+    return {
+        'duration_s': duration,
+        'n_trial_accepted': 0 if obs is None else int(obs.n_trial),
+        'stage': stats['stage']
+    }
+
+
+def time_extract_observations(fp_db, fp_tmp, n_repeat, grade_mode, stream):
+    """Time `extract_observations` on fresh database copies."""
+    duration = []
+    for _ in range(n_repeat):
+        shutil.copyfile(fp_db, fp_tmp)
+        pzc_connection.set_backend(pzc_connection.sqlite_backend(fp_tmp))
+        fp_project = Path.home() / Path('.psiz-collect', 'projects')
+        if os.path.exists(fp_project):
+            shutil.rmtree(fp_project)
+        os.makedirs(fp_project / Path(PROJECT_ID))
+        time_start = time.perf_counter()
+        report = pzc_extract.extract_observations(
+            PROJECT_ID, grade_mode=grade_mode, use_preexist=False,
+            stream=stream
+        )
+        duration.append(time.perf_counter() - time_start)
+    return {
+        'duration_s': duration,
+        'n_assignment_new': report['n_assignment_new'],
+        'n_trial_new': report['n_trial_new'],
+        'stage': report['stage']
+    }
+
+
+def time_summarize_observations(fp_db, n_repeat, grade_mode):
+    """Time `summarize_observations`."""
+    pzc_connection.set_backend(pzc_connection.sqlite_backend(fp_db))
+    duration = []
+    for _ in range(n_repeat):
+        time_start = time.perf_counter()
+        meta = pzc_extract.summarize_observations(
+            PROJECT_ID, grade_mode=grade_mode
+        )
+        duration.append(time.perf_counter() - time_start)
+    return {
+        'duration_s': duration,
+        'n_assignment': len(meta.index)
+    }
+
+
+def main(args):
+    """Run benchmark."""
+    dir_tmp = tempfile.mkdtemp()
+    # Keep project files out of the real home directory.
+    os.environ['HOME'] = dir_tmp
+    fp_db = os.path.join(dir_tmp, 'bench.db')
+    fp_tmp = os.path.join(dir_tmp, 'bench_copy.db')
+
+    result = {'config': vars(args), 'run': []}
+    try:
+        for n_trial in args.n_trial:
+            if os.path.exists(fp_db):
+                os.remove(fp_db)
+            time_start = time.perf_counter()
+            n_assignment = synthetic.generate(
+                fp_db, project_id=PROJECT_ID, n_trial=n_trial,
+                n_trial_per_assignment=args.n_trial_per_assignment,
+                n_reference=tuple(args.n_reference),
+                catch_ratio=args.catch_ratio, seed=args.seed
+            )
+            time_generate = time.perf_counter() - time_start
+
+            run = {
+                'n_trial': n_trial,
+                'n_assignment': n_assignment,
+                'generate_s': time_generate,
+                'fetch_assignment': time_fetch_assignment(
+                    fp_db, args.n_repeat
+                ),
+                'assemble_accepted_obs': time_assemble_accepted_obs(
+                    fp_db, fp_tmp, args.n_repeat, args.grade_mode
+                ),
+                'extract_observations': time_extract_observations(
+                    fp_db, fp_tmp, args.n_repeat, args.grade_mode,
+                    args.stream
+                ),
+                'summarize_observations': time_summarize_observations(
+                    fp_tmp, args.n_repeat, args.grade_mode
+                )
+            }
+            result['run'].append(run)
+
+            print('n_trial={0} n_assignment={1}'.format(n_trial, n_assignment))
+            for name in [
+                    'fetch_assignment', 'assemble_accepted_obs',
+                    'extract_observations', 'summarize_observations']:
+                print('    {0:<24} {1:.4f} s (median of {2})'.format(
+                    name, np.median(run[name]['duration_s']), args.n_repeat
+                ))
+    finally:
+        pzc_connection.set_backend(None)
+        shutil.rmtree(dir_tmp)
+
+    if args.fp_out is not None:
+        with open(args.fp_out, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--n_trial', type=int, nargs='+', default=[1000, 10000, 100000]
+    )
+    parser.add_argument('--n_trial_per_assignment', type=int, default=50)
+    parser.add_argument('--n_reference', type=int, nargs=2, default=[2, 8])
+    parser.add_argument('--catch_ratio', type=float, default=.1)
+    parser.add_argument('--grade_mode', type=str, default='lenient')
+    parser.add_argument('--stream', action='store_true')
+    parser.add_argument('--n_repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=252)
+    parser.add_argument(
+        '--fp_out', type=str, default=None, help='JSON output file.'
+    )
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 The PsiZ Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Micro-benchmark of `extract.filter_assignment`.
+
+Compares the set-membership implementation against the previous
+implementation that OR-ed a full-length mask for every new assignment
+ID. The default sizes correspond to 100k total assignments of which
+10k are new.
+
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from psizcollect.extract import filter_assignment
+
+
+def filter_assignment_loop(df_assignment, meta_pre):
+    """Filter assignments using the previous per-ID loop."""
+    assignment_id_set_pre = meta_pre['assignment_id'].values
+    assignment_id_set = df_assignment['assignment_id'].values
+    assignment_id_set_new = np.setdiff1d(
+        assignment_id_set, assignment_id_set_pre, assume_unique=False
+    )
+    locs = np.zeros([len(df_assignment.index)], dtype=bool)
+    for assignment_id_new in assignment_id_set_new:
+        locs = np.logical_or(
+            locs, np.equal(assignment_id_set, assignment_id_new)
+        )
+    return df_assignment[locs]
+
+
+def main(n_total, n_new):
+    """Run benchmark."""
+    assignment_id = np.random.permutation(n_total) + 1
+    df_assignment = pd.DataFrame({
+        'assignment_id': assignment_id,
+        'status_code': np.ones([n_total], dtype=int)
+    })
+    meta_pre = pd.DataFrame({
+        'assignment_id': np.sort(assignment_id)[0:(n_total - n_new)]
+    })
+
+    time_start = time.perf_counter()
+    df_new = filter_assignment(df_assignment, meta_pre)
+    time_set = time.perf_counter() - time_start
+
+    time_start = time.perf_counter()
+    df_new_loop = filter_assignment_loop(df_assignment, meta_pre)
+    time_loop = time.perf_counter() - time_start
+
+    if not df_new.equals(df_new_loop):
+        raise RuntimeError('Implementations disagree.')
+
+    print('n_total={0} n_new={1}'.format(n_total, n_new))
+    print('    set-membership: {0:.4f} s'.format(time_set))
+    print('    per-ID loop:    {0:.4f} s'.format(time_loop))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n_total', type=int, default=100000)
+    parser.add_argument('--n_new', type=int, default=10000)
+    args = parser.parse_args()
+    main(args.n_total, args.n_new)
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 The PsiZ Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Equivalence check and benchmark of `preprocess.grade_catch_trials`.
+
+The mask-based implementation is compared against the previous
+per-trial implementation for every grade mode on randomized
+observations (varying numbers of references and selections, ranked
+and unranked trials, correct and incorrect catch trials, and
+observations without catch trials). Afterwards, both implementations
+are timed on a large set of observations.
+
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from psizcollect.preprocess import grade_catch_trials
+
+import synthetic
+
+GRADE_MODE_LIST = ['lenient', 'strict', 'partial']
+
+
+def grade_catch_trials_loop(obs, grade_mode='lenient'):
+    """Grade catch trials using the previous per-trial loop."""
+    n_trial = obs.n_trial
+    is_catch = np.zeros([n_trial], dtype=bool)
+    for i_trial in range(n_trial):
+        is_identical = np.equal(
+            obs.stimulus_set[i_trial, 0], obs.stimulus_set[i_trial, 1:]
+        )
+        if np.sum(is_identical) > 0:
+            is_catch[i_trial] = True
+    grade = np.zeros([n_trial])
+
+    for i_trial in range(n_trial):
+        if is_catch[i_trial]:
+            is_identical = np.equal(
+                obs.stimulus_set[i_trial, 0], obs.stimulus_set[i_trial, 1:]
+            )
+            if grade_mode == 'lenient':
+                is_identical_selected = is_identical[0:obs.n_select[i_trial]]
+                if np.sum(is_identical_selected) > 0:
+                    grade[i_trial] = 1
+            elif grade_mode == 'strict':
+                if obs.is_ranked[i_trial]:
+                    is_identical_selected = is_identical[0]
+                else:
+                    is_identical_selected = is_identical[
+                        0:obs.n_select[i_trial]
+                    ]
+                if np.sum(is_identical_selected) > 0:
+                    grade[i_trial] = 1
+            elif grade_mode == 'partial':
+                if obs.is_ranked[i_trial]:
+                    is_identical_selected = is_identical[0]
+                    if is_identical_selected:
+                        grade[i_trial] = 1
+                    else:
+                        is_identical_selected = is_identical[
+                            0:obs.n_select[i_trial]
+                        ]
+                        if np.sum(is_identical_selected) > 0:
+                            grade[i_trial] = .5
+                else:
+                    is_identical_selected = is_identical[
+                        0:obs.n_select[i_trial]
+                    ]
+                    if np.sum(is_identical_selected) > 0:
+                        grade[i_trial] = 1
+            else:
+                raise ValueError((
+                    "The argument `grade_mode` must be 'strict', 'partial' or"
+                    " 'lenient'."
+                ))
+
+    grade = grade[is_catch]
+    if len(grade) > 0:
+        n_catch = np.sum(is_catch)
+        avg_grade = np.sum(grade) / n_catch
+    else:
+        avg_grade = np.nan
+
+    return (avg_grade, grade, is_catch)
+
+
+def check_equivalence(n_case, n_trial):
+    """Compare both implementations on randomized observations."""
+    rng = np.random.RandomState(252)
+    for i_case in range(n_case):
+        n_ref_max = rng.randint(2, 9)
+        n_ref_min = rng.randint(2, n_ref_max + 1)
+        n_select_max = rng.randint(1, n_ref_max)
+        obs = synthetic.generate_obs(
+            n_trial=n_trial, n_reference=(n_ref_min, n_ref_max),
+            n_select=(1, n_select_max), catch_ratio=rng.choice([0., .2, 1.]),
+            p_correct=rng.rand(), n_stimuli=rng.choice([20, 10000]),
+            seed=i_case
+        )
+        for grade_mode in GRADE_MODE_LIST:
+            (avg, grade, is_catch) = grade_catch_trials(
+                obs, grade_mode=grade_mode
+            )
+            (avg_loop, grade_loop, is_catch_loop) = grade_catch_trials_loop(
+                obs, grade_mode=grade_mode
+            )
+            is_equal = (
+                np.array_equal(is_catch, is_catch_loop) and
+                np.array_equal(grade, grade_loop) and
+                np.allclose(avg, avg_loop, equal_nan=True)
+            )
+            if not is_equal:
+                raise RuntimeError(
+                    'Implementations disagree (case {0}, {1}).'.format(
+                        i_case, grade_mode
+                    )
+                )
+    print('Equivalent on {0} randomized cases x {1} modes.'.format(
+        n_case, len(GRADE_MODE_LIST)
+    ))
+
+
+def main(args):
+    """Run equivalence check and benchmark."""
+    check_equivalence(args.n_case, args.n_trial_case)
+
+    obs = synthetic.generate_obs(n_trial=args.n_trial)
+    print('n_trial={0}'.format(args.n_trial))
+    for grade_mode in GRADE_MODE_LIST:
+        time_start = time.perf_counter()
+        grade_catch_trials(obs, grade_mode=grade_mode)
+        time_mask = time.perf_counter() - time_start
+
+        time_start = time.perf_counter()
+        grade_catch_trials_loop(obs, grade_mode=grade_mode)
+        time_loop = time.perf_counter() - time_start
+        print(
+            '    {0:<8} mask-based: {1:.4f} s | '
+            'per-trial loop: {2:.4f} s'.format(
+                grade_mode, time_mask, time_loop
+            )
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n_case', type=int, default=200)
+    parser.add_argument('--n_trial_case', type=int, default=500)
+    parser.add_argument('--n_trial', type=int, default=1000000)
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 The PsiZ Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Micro-benchmark of `preprocess.identify_catch_trials`.
+
+Compares the broadcast implementation against the previous
+implementation that compared the query with the references of one
+trial at a time. The default size is 10^6 trials.
+
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from psizcollect.preprocess import identify_catch_trials
+
+import synthetic
+
+
+def identify_catch_trials_loop(obs):
+    """Identify catch trials using the previous per-trial loop."""
+    n_trial = obs.n_trial
+    is_catch = np.zeros([n_trial], dtype=bool)
+    for i_trial in range(n_trial):
+        is_identical = np.equal(
+            obs.stimulus_set[i_trial, 0], obs.stimulus_set[i_trial, 1:]
+        )
+        if np.sum(is_identical) > 0:
+            is_catch[i_trial] = True
+    return is_catch
+
+
+def main(n_trial, catch_ratio):
+    """Run benchmark."""
+    obs = synthetic.generate_obs(n_trial=n_trial, catch_ratio=catch_ratio)
+
+    time_start = time.perf_counter()
+    is_catch = identify_catch_trials(obs)
+    time_broadcast = time.perf_counter() - time_start
+
+    time_start = time.perf_counter()
+    is_catch_loop = identify_catch_trials_loop(obs)
+    time_loop = time.perf_counter() - time_start
+
+    if not np.array_equal(is_catch, is_catch_loop):
+        raise RuntimeError('Implementations disagree.')
+
+    print('n_trial={0} n_catch={1}'.format(n_trial, np.sum(is_catch)))
+    print('    broadcast:      {0:.4f} s'.format(time_broadcast))
+    print('    per-trial loop: {0:.4f} s'.format(time_loop))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n_trial', type=int, default=1000000)
+    parser.add_argument('--catch_ratio', type=float, default=.1)
+    args = parser.parse_args()
+    main(args.n_trial, args.catch_ratio)
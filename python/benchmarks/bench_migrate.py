@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 The PsiZ Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Before/after benchmark of the schema migrations.
+
+A synthetic SQLite database with several projects is generated (see
+`synthetic.py`). The query plans and timings of the extraction and
+protocol-selection queries are recorded, all migrations are applied
+(see `psizcollect.migrate`), and the queries are measured again.
+Results are printed and optionally written as JSON.
+
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+import psizcollect.connection as pzc_connection
+import psizcollect.extract as pzc_extract
+import psizcollect.migrate as pzc_migrate
+
+import synthetic
+
+
+def query_dict(project_id, assignment_id_list):
+    """Return the benchmarked queries."""
+    return {
+        'fetch_assignment': (
+            "SELECT assignment_id, protocol_id, worker_id, status_code, "
+            "begin_hit, end_hit, ver FROM assignment WHERE project_id=%s",
+            (project_id,)
+        ),
+        'fetch_assignment_incremental': (
+            "SELECT assignment_id, protocol_id, worker_id, status_code, "
+            "begin_hit, end_hit, ver FROM assignment WHERE project_id=%s "
+            "AND assignment_id>%s",
+            (project_id, int(np.max(assignment_id_list)) - 10)
+        ),
+        'protocol_history': (
+            "SELECT protocol_id FROM assignment WHERE project_id=%s AND "
+            "(status_code=0 OR status_code=1)",
+            (project_id,)
+        ),
+        'fetch_trial': (
+            pzc_extract._query_trial(len(assignment_id_list)),
+            tuple(int(i) for i in assignment_id_list)
+        ),
+    }
+
+
+def measure(my_cxn, queries, n_repeat):
+    """Record query plan and timing of every query."""
+    result = {}
+    for name, (query, vals) in queries.items():
+        plan = pzc_migrate.explain(my_cxn, query, vals)
+        duration = []
+        for _ in range(n_repeat):
+            my_cursor = my_cxn.cursor()
+            time_start = time.perf_counter()
+            my_cursor.execute(query, vals)
+            my_cursor.fetchall()
+            duration.append(time.perf_counter() - time_start)
+            my_cursor.close()
+        result[name] = {
+            'plan': [str(row[-1]) for row in plan],
+            'duration_s': duration
+        }
+    return result
+
+
+def main(args):
+    """Run benchmark."""
+    dir_tmp = tempfile.mkdtemp()
+    fp_db = os.path.join(dir_tmp, 'bench.db')
+    try:
+        for idx in range(args.n_project):
+            synthetic.generate(
+                fp_db, project_id='project_{0}'.format(idx),
+                n_trial=args.n_trial, seed=args.seed + idx
+            )
+        pzc_connection.set_backend(pzc_connection.sqlite_backend(fp_db))
+        my_cxn = pzc_connection.get_connection()
+
+        project_id = 'project_{0}'.format(args.n_project // 2)
+        df_assignment = pzc_extract.fetch_assignment(my_cxn, project_id)
+        assignment_id_list = df_assignment['assignment_id'].values[
+            0:args.n_assignment_trial
+        ]
+        queries = query_dict(project_id, assignment_id_list)
+
+        result = {'config': vars(args)}
+        result['before'] = measure(my_cxn, queries, args.n_repeat)
+        time_start = time.perf_counter()
+        result['version'] = pzc_migrate.migrate(my_cxn, verbose=1)
+        result['migrate_s'] = time.perf_counter() - time_start
+        result['missing'] = pzc_migrate.verify(my_cxn)
+        result['after'] = measure(my_cxn, queries, args.n_repeat)
+        my_cxn.close()
+    finally:
+        pzc_connection.set_backend(None)
+        shutil.rmtree(dir_tmp)
+
+    print('Schema version {0}, migrated in {1:.2f} s'.format(
+        result['version'], result['migrate_s']
+    ))
+    for name in queries:
+        print(name)
+        for key in ['before', 'after']:
+            print('    {0:<6} {1:.5f} s | {2}'.format(
+                key, np.median(result[key][name]['duration_s']),
+                '; '.join(result[key][name]['plan'])
+            ))
+
+    if args.fp_out is not None:
+        with open(args.fp_out, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n_project', type=int, default=10)
+    parser.add_argument(
+        '--n_trial', type=int, default=20000, help='Trials per project.'
+    )
+    parser.add_argument(
+        '--n_assignment_trial', type=int, default=100,
+        help='Assignments requested by the trial query.'
+    )
+    parser.add_argument('--n_repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=252)
+    parser.add_argument(
+        '--fp_out', type=str, default=None, help='JSON output file.'
+    )
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 The PsiZ Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Benchmark of `preprocess.quality_control`.
+
+Compares the single-pass grouped implementation against the previous
+implementation that created a subset of the observations and regraded
+it for every agent. Both must return the same observations and the
+same `df_grade`.
+
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from psizcollect.preprocess import grade_catch_trials, quality_control
+
+import synthetic
+
+OBS_ATTR = [
+    'stimulus_set', 'n_select', 'is_ranked', 'agent_id', 'session_id',
+    'weight', 'rt_ms'
+]
+
+
+def quality_control_loop(obs, grade_thresh=1.0, grade_mode='lenient'):
+    """Remove agents using the previous per-agent loop."""
+    agent_list = np.unique(obs.agent_id)
+    grade_record = {
+        'agent_id': agent_list,
+        'grade': np.zeros(len(agent_list)),
+        'is_retained': np.ones(len(agent_list), dtype=bool)
+    }
+
+    keep_locs = np.ones([obs.n_trial], dtype=bool)
+    for idx, i_agent in enumerate(agent_list):
+        agent_locs = np.equal(obs.agent_id, i_agent)
+        obs_agent = obs.subset(agent_locs)
+        (avg_grade, _, _) = grade_catch_trials(
+            obs_agent, grade_mode=grade_mode
+        )
+        grade_record['grade'][idx] = avg_grade
+        if avg_grade < grade_thresh:
+            keep_locs[agent_locs] = False
+            grade_record['is_retained'][idx] = False
+
+    obs_new = obs.subset(keep_locs)
+    df_grade = pd.DataFrame.from_dict(grade_record)
+    return obs_new, df_grade
+
+
+def main(args):
+    """Run benchmark."""
+    obs = synthetic.generate_obs(
+        n_trial=args.n_trial, n_agent=args.n_agent,
+        catch_ratio=args.catch_ratio, p_correct=.8
+    )
+    print('n_trial={0} n_agent={1}'.format(args.n_trial, args.n_agent))
+    for grade_mode in ['lenient', 'strict', 'partial']:
+        time_start = time.perf_counter()
+        (obs_new, df_grade) = quality_control(
+            obs, grade_thresh=args.grade_thresh, grade_mode=grade_mode
+        )
+        time_grouped = time.perf_counter() - time_start
+
+        time_start = time.perf_counter()
+        (obs_loop, df_grade_loop) = quality_control_loop(
+            obs, grade_thresh=args.grade_thresh, grade_mode=grade_mode
+        )
+        time_loop = time.perf_counter() - time_start
+
+        is_equal = df_grade.equals(df_grade_loop) and all(
+            np.array_equal(getattr(obs_new, key), getattr(obs_loop, key))
+            for key in OBS_ATTR
+        )
+        if not is_equal:
+            raise RuntimeError('Implementations disagree.')
+        print(
+            '    {0:<8} grouped: {1:.4f} s | per-agent loop: {2:.4f} s | '
+            'retained {3}/{4} agents'.format(
+                grade_mode, time_grouped, time_loop,
+                np.sum(df_grade['is_retained'].values), len(df_grade.index)
+            )
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n_trial', type=int, default=1000000)
+    parser.add_argument('--n_agent', type=int, default=5000)
+    parser.add_argument('--catch_ratio', type=float, default=.05)
+    parser.add_argument('--grade_thresh', type=float, default=.8)
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 The PsiZ Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Benchmark of `preprocess.sweep_grade_threshold`.
+
+Compares a single sweep over a vector of grade thresholds and all
+grade modes against calling `preprocess.quality_control` once per
+combination. The retained agents and observations of every
+combination must match. The default size is 2*10^6 trials.
+
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from psizcollect.preprocess import quality_control, sweep_grade_threshold
+
+import synthetic
+
+
+def main(args):
+    """Run benchmark."""
+    obs = synthetic.generate_obs(
+        n_trial=args.n_trial, n_agent=args.n_agent,
+        catch_ratio=args.catch_ratio, p_correct=.8
+    )
+    grade_thresh_list = np.linspace(0., 1., args.n_thresh)
+
+    time_start = time.perf_counter()
+    (df_sweep, df_grade, is_retained, keep_locs) = sweep_grade_threshold(
+        obs, grade_thresh_list
+    )
+    time_sweep = time.perf_counter() - time_start
+
+    time_loop = 0.
+    n_combination = 0
+    for grade_mode in is_retained:
+        for idx, grade_thresh in enumerate(grade_thresh_list):
+            time_start = time.perf_counter()
+            (obs_qc, df_qc) = quality_control(
+                obs, grade_thresh=grade_thresh, grade_mode=grade_mode
+            )
+            time_loop = time_loop + time.perf_counter() - time_start
+            n_combination = n_combination + 1
+            is_equal = (
+                np.array_equal(
+                    is_retained[grade_mode][idx], df_qc['is_retained'].values
+                ) and
+                np.array_equal(
+                    obs.stimulus_set[keep_locs[grade_mode][idx]],
+                    obs_qc.stimulus_set
+                ) and
+                np.allclose(
+                    df_grade['grade_{0}'.format(grade_mode)].values,
+                    df_qc['grade'].values, equal_nan=True
+                )
+            )
+            if not is_equal:
+                raise RuntimeError(
+                    'Sweep disagrees with quality_control ({0}, {1}).'.format(
+                        grade_mode, grade_thresh
+                    )
+                )
+
+    print('n_trial={0} n_agent={1} n_combination={2}'.format(
+        args.n_trial, args.n_agent, n_combination
+    ))
+    print('    sweep:                           {0:.4f} s'.format(time_sweep))
+    print('    quality_control per combination: {0:.4f} s'.format(time_loop))
+    print(df_sweep[df_sweep['grade_mode'] == 'lenient'].to_string(index=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n_trial', type=int, default=2000000)
+    parser.add_argument('--n_agent', type=int, default=10000)
+    parser.add_argument('--catch_ratio', type=float, default=.05)
+    parser.add_argument('--n_thresh', type=int, default=11)
+    args = parser.parse_args()
+    main(args)
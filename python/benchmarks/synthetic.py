@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 The PsiZ Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Generate synthetic psiz-collect data.
+
+The `assignment` and `trial` tables mirror `sql/install_db_psiz.sql`
+and are written to a local SQLite database that can be used with
+`psizcollect.connection.sqlite_backend`. Observations can also be
+generated directly in memory.
+
+Functions:
+    create_schema: Create the `assignment` and `trial` tables.
+    generate: Fill the tables with synthetic data.
+    generate_obs: Generate synthetic observations.
+
+"""
+
+import argparse
+from datetime import datetime, timedelta
+import sqlite3
+
+import numpy as np
+import psiz.trials
+
+SCHEMA = [
+    (
+        "CREATE TABLE IF NOT EXISTS assignment ("
+        "assignment_id INTEGER PRIMARY KEY AUTOINCREMENT, "
+        "project_id CHAR(255) NOT NULL, "
+        "protocol_id CHAR(255) NOT NULL, "
+        "worker_id CHAR(255) NOT NULL, "
+        "amt_assignment_id CHAR(255) NOT NULL, "
+        "amt_hit_id CHAR(255) NOT NULL, "
+        "browser CHAR(255) NOT NULL, "
+        "platform CHAR(255) NOT NULL, "
+        "begin_hit TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP, "
+        "end_hit TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP, "
+        "status_code SMALLINT DEFAULT 0, "
+        "ver INT NOT NULL DEFAULT 2)"
+    ),
+    (
+        "CREATE TABLE IF NOT EXISTS trial ("
+        "trial_id INTEGER PRIMARY KEY AUTOINCREMENT, "
+        "assignment_id INT NOT NULL, "
+        "n_select INT UNSIGNED NOT NULL, "
+        "is_ranked INT UNSIGNED NOT NULL, "
+        "q_idx INT NOT NULL, "
+        "r1_idx INT NOT NULL, r2_idx INT NOT NULL, r3_idx INT, r4_idx INT, "
+        "r5_idx INT, r6_idx INT, r7_idx INT, r8_idx INT, "
+        "c1_idx INT NOT NULL, c2_idx INT NOT NULL, c3_idx INT, c4_idx INT, "
+        "c5_idx INT, c6_idx INT, c7_idx INT, c8_idx INT, "
+        "start_ms TIMESTAMP DEFAULT CURRENT_TIMESTAMP, "
+        "c1_rt_ms INT UNSIGNED, c2_rt_ms INT UNSIGNED, "
+        "c3_rt_ms INT UNSIGNED, c4_rt_ms INT UNSIGNED, "
+        "c5_rt_ms INT UNSIGNED, c6_rt_ms INT UNSIGNED, "
+        "c7_rt_ms INT UNSIGNED, c8_rt_ms INT UNSIGNED, "
+        "submit_rt_ms INT UNSIGNED NOT NULL, "
+        "is_catch_trial TINYINT(1), "
+        "rating TINYINT, "
+        "FOREIGN KEY (assignment_id) REFERENCES assignment(assignment_id) "
+        "ON DELETE CASCADE)"
+    )
+]
+
+N_MAX_REF = 8
+# Number of trial rows inserted at a time.
+INSERT_CHUNK_SIZE = 100000
+
+
+def create_schema(cxn):
+    """Create the `assignment` and `trial` tables.
+
+    Arguments:
+        cxn: A sqlite3.Connection object.
+
+    """
+    for query in SCHEMA:
+        cxn.execute(query)
+    cxn.commit()
+
+
+def generate(
+        fp_db, project_id='bench', n_trial=10000, n_trial_per_assignment=50,
+        n_reference=(2, 8), n_select=(1, 2), catch_ratio=.1,
+        p_correct=.9, p_incomplete=.05, n_stimuli=1000, seed=252):
+    """Fill the tables with synthetic data.
+
+    Arguments:
+        fp_db: The file path of the SQLite database.
+        project_id (optional): The project ID of all assignments.
+        n_trial (optional): The total number of trials.
+        n_trial_per_assignment (optional): The number of trials per
+            completed assignment.
+        n_reference (optional): A tuple `(min, max)` of the number of
+            references of a trial. Must be between 2 and 8.
+        n_select (optional): A tuple `(min, max)` of the number of
+            selections of a trial.
+        catch_ratio (optional): The proportion of catch trials.
+        p_correct (optional): The probability that a catch trial is
+            answered correctly.
+        p_incomplete (optional): The proportion of additional
+            assignments that are incomplete and have no trials.
+        n_stimuli (optional): The number of unique stimuli.
+        seed (optional): The random seed.
+
+    Returns:
+        n_assignment: The number of generated assignments.
+
+    """
+    if n_reference[0] < 2 or n_reference[1] > N_MAX_REF:
+        raise ValueError(
+            "The argument `n_reference` must be between 2 and {0}.".format(
+                N_MAX_REF
+            )
+        )
+    if n_stimuli <= N_MAX_REF:
+        raise ValueError(
+            "The argument `n_stimuli` must be greater than {0}.".format(
+                N_MAX_REF
+            )
+        )
+    rng = np.random.RandomState(seed)
+    cxn = sqlite3.connect(fp_db, detect_types=sqlite3.PARSE_DECLTYPES)
+    create_schema(cxn)
+
+    # Assignments.
+    n_complete = int(np.ceil(n_trial / n_trial_per_assignment))
+    n_incomplete = int(np.round(p_incomplete * n_complete))
+    n_assignment = n_complete + n_incomplete
+    n_worker = np.maximum(1, n_assignment // 2)
+    begin_hit = datetime(2020, 1, 1)
+    row_assignment = []
+    for idx in range(n_assignment):
+        is_complete = idx < n_complete
+        duration = timedelta(minutes=int(rng.randint(5, 40)))
+        row_assignment.append((
+            project_id,
+            'protocol_{0}'.format(rng.randint(100)),
+            'worker_{0}'.format(rng.randint(n_worker)),
+            '', '', '', '',
+            begin_hit + timedelta(minutes=idx),
+            begin_hit + timedelta(minutes=idx) + duration,
+            (1 if is_complete else 0)
+        ))
+    cursor = cxn.cursor()
+    cursor.execute("SELECT COALESCE(MAX(assignment_id), 0) FROM assignment")
+    assignment_id_start = cursor.fetchone()[0] + 1
+    cursor.executemany(
+        "INSERT INTO assignment (project_id, protocol_id, worker_id, "
+        "amt_assignment_id, amt_hit_id, browser, platform, begin_hit, "
+        "end_hit, status_code) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        row_assignment
+    )
+
+    # Trials.
+    assignment_id = (
+        assignment_id_start +
+        np.arange(n_trial) // n_trial_per_assignment
+    )
+    n_ref = rng.randint(n_reference[0], n_reference[1] + 1, size=n_trial)
+    n_sel = np.minimum(
+        rng.randint(n_select[0], n_select[1] + 1, size=n_trial), n_ref - 1
+    )
+    n_sel = np.maximum(n_sel, 1)
+    is_ranked = rng.randint(2, size=n_trial)
+
+    # Distinct references via distinct offsets from the query.
+    query = rng.randint(n_stimuli, size=n_trial)
+    offset = 1 + np.argsort(rng.rand(n_trial, N_MAX_REF), axis=1)
+    choice = (query[:, np.newaxis] + offset) % n_stimuli
+
+    # Catch trials contain a copy of the query among the references.
+    is_catch = rng.rand(n_trial) < catch_ratio
+    is_correct = rng.rand(n_trial) < p_correct
+    loc_catch = np.where(
+        is_correct, rng.randint(0, n_sel), rng.randint(n_sel, n_ref)
+    )
+    choice[is_catch, loc_catch[is_catch]] = query[is_catch]
+
+    rt_ms = rng.randint(200, 4000, size=(n_trial, N_MAX_REF))
+    submit_rt_ms = rng.randint(1000, 10000, size=n_trial)
+
+    # Trial rows in column order, start_ms is filled in per chunk.
+    row_trial = np.hstack([
+        assignment_id[:, np.newaxis], n_sel[:, np.newaxis],
+        is_ranked[:, np.newaxis], query[:, np.newaxis], choice, choice,
+        np.zeros([n_trial, 1], dtype=int), rt_ms,
+        submit_rt_ms[:, np.newaxis], is_catch[:, np.newaxis].astype(int)
+    ])
+    # Unused references (and their response times) are NULL.
+    is_unused = np.arange(N_MAX_REF)[np.newaxis, :] >= n_ref[:, np.newaxis]
+    is_null = np.zeros(row_trial.shape, dtype=bool)
+    is_null[:, 4:12] = is_unused
+    is_null[:, 12:20] = is_unused
+    is_null[:, 21:29] = is_unused
+    for idx_start in range(0, n_trial, INSERT_CHUNK_SIZE):
+        idx_end = idx_start + INSERT_CHUNK_SIZE
+        row_chunk = row_trial[idx_start:idx_end].astype(object)
+        row_chunk[is_null[idx_start:idx_end]] = None
+        row_chunk[:, 20] = begin_hit
+        cursor.executemany(
+            "INSERT INTO trial (assignment_id, n_select, is_ranked, q_idx, "
+            "r1_idx, r2_idx, r3_idx, r4_idx, r5_idx, r6_idx, r7_idx, "
+            "r8_idx, c1_idx, c2_idx, c3_idx, c4_idx, c5_idx, c6_idx, "
+            "c7_idx, c8_idx, start_ms, c1_rt_ms, c2_rt_ms, c3_rt_ms, "
+            "c4_rt_ms, c5_rt_ms, c6_rt_ms, c7_rt_ms, c8_rt_ms, "
+            "submit_rt_ms, is_catch_trial) "
+            "VALUES ({0})".format(", ".join(["?"] * 31)),
+            row_chunk.tolist()
+        )
+    cxn.commit()
+    cursor.close()
+    cxn.close()
+    return n_assignment
+
+
+def generate_obs(
+        n_trial=10000, n_reference=(2, 8), n_select=(1, 2), catch_ratio=.1,
+        p_correct=.9, n_agent=100, n_stimuli=10000, seed=252):
+    """Generate synthetic observations.
+
+    Arguments:
+        n_trial (optional): The number of trials.
+        n_reference (optional): A tuple `(min, max)` of the number of
+            references of a trial. Must be between 2 and 8.
+        n_select (optional): A tuple `(min, max)` of the number of
+            selections of a trial.
+        catch_ratio (optional): The proportion of catch trials.
+        p_correct (optional): The probability that a catch trial is
+            answered correctly, i.e., the copy of the query is
+            selected. Correct answers of ranked trials place the copy
+            at a random selected position.
+        n_agent (optional): The number of agents.
+        n_stimuli (optional): The number of unique stimuli.
+        seed (optional): The random seed.
+
+    Returns:
+        obs: A psiz.trials.RankObservations object.
+
+    """
+    rng = np.random.RandomState(seed)
+    n_ref = rng.randint(n_reference[0], n_reference[1] + 1, size=n_trial)
+    n_sel = np.minimum(
+        rng.randint(n_select[0], n_select[1] + 1, size=n_trial), n_ref - 1
+    )
+    n_sel = np.maximum(n_sel, 1)
+
+    # Distinct references via distinct offsets from the query.
+    query = rng.randint(n_stimuli, size=n_trial)
+    offset = 1 + np.argsort(rng.rand(n_trial, N_MAX_REF), axis=1)
+    stimulus_set = np.hstack([
+        query[:, np.newaxis], (query[:, np.newaxis] + offset) % n_stimuli
+    ])
+
+    is_catch = rng.rand(n_trial) < catch_ratio
+    is_correct = rng.rand(n_trial) < p_correct
+    loc_catch = np.where(
+        is_correct, rng.randint(0, n_sel), rng.randint(n_sel, n_ref)
+    )
+    stimulus_set[is_catch, 1 + loc_catch[is_catch]] = query[is_catch]
+
+    is_unused = np.arange(N_MAX_REF)[np.newaxis, :] >= n_ref[:, np.newaxis]
+    stimulus_set[:, 1:][is_unused] = -1
+
+    obs = psiz.trials.RankObservations(
+        stimulus_set, n_select=n_sel,
+        is_ranked=rng.randint(2, size=n_trial),
+        agent_id=rng.randint(n_agent, size=n_trial),
+        session_id=rng.randint(n_agent, size=n_trial),
+        rt_ms=rng.randint(1000, 10000, size=n_trial)
+    )
+    return obs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('fp_db', type=str, help='SQLite database file.')
+    parser.add_argument('--project_id', type=str, default='bench')
+    parser.add_argument('--n_trial', type=int, default=10000)
+    parser.add_argument('--n_reference', type=int, nargs=2, default=[2, 8])
+    parser.add_argument('--catch_ratio', type=float, default=.1)
+    parser.add_argument('--seed', type=int, default=252)
+    args = parser.parse_args()
+    generate(
+        args.fp_db, project_id=args.project_id, n_trial=args.n_trial,
+        n_reference=tuple(args.n_reference), catch_ratio=args.catch_ratio,
+        seed=args.seed
+    )
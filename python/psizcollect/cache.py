@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 The PsiZ Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Module for caching raw trial rows of completed assignments.
+
+The trials of an assignment do not change once the assignment is
+completed. Their raw rows (as returned by the trial query, see
+`psizcollect.extract.fetch_trial`) can therefore be kept on local disk
+so that regrading does not have to fetch them from the database again.
+
+Each project has a single cache file with one dataset per assignment:
+
+```
+.psiz-collect/cache/
++-- <project_id_0>.hdf5
+    +-- <assignment_id_0>
+    +-- <assignment_id_1>
++-- <project_id_1>.hdf5
+```
+
+A fragment is a float array with one row per trial and the columns of
+the trial query. NULL values are stored as NaN and timestamps as POSIX
+seconds. Fragments are never overwritten.
+
+The total size of the cache is bounded. When the bound is exceeded,
+the cache files of the least recently used projects (e.g., retired
+projects) are evicted as a whole.
+
+Functions:
+    get_fragment_path: Return the cache file of a project.
+    to_fragment: Convert trial rows to a fragment.
+    load_fragments: Load cached fragments.
+    save_fragments: Add fragments to the cache.
+    evict: Evict least recently used projects.
+    clear_fragments: Remove the cache file of a project.
+
+"""
+
+from datetime import datetime
+import os
+from pathlib import Path
+
+import h5py
+import numpy as np
+
+DIR_CACHE = Path('.psiz-collect', 'cache')
+# Default bound of the total cache size in bytes.
+CACHE_MAX_BYTE = 2 * 1024**3
+
+
+def get_fragment_path(project_id):
+    """Return the cache file of a project.
+
+    Arguments:
+        project_id: String indicating project ID.
+
+    Returns:
+        fp_fragment: The file path of the cache file.
+
+    """
+    return Path.home() / DIR_CACHE / Path('{0}.hdf5'.format(project_id))
+
+
+def to_fragment(rows):
+    """Convert trial rows to a fragment.
+
+    Arguments:
+        rows: A list of trial rows.
+
+    Returns:
+        fragment: A float array.
+            shape = (n_trial, n_column)
+
+    """
+    fragment = np.array(rows, dtype=object)
+    is_null = np.equal(fragment, None)
+    fragment[is_null] = np.nan
+    # All rows of the trial query share the column types.
+    for i_col, value in enumerate(rows[0]):
+        if isinstance(value, datetime):
+            fragment[:, i_col] = [
+                v.timestamp() if isinstance(v, datetime) else np.nan
+                for v in fragment[:, i_col]
+            ]
+    return fragment.astype(float)
+
+
+def load_fragments(fp_fragment, assignment_id_list):
+    """Load cached fragments.
+
+    Arguments:
+        fp_fragment: The file path of the cache file.
+        assignment_id_list: The requested assignment IDs.
+
+    Returns:
+        fragment_dict: A dictionary mapping assignment IDs to
+            fragments. Assignments that are not cached are not
+            included.
+
+    """
+    fragment_dict = {}
+    if not os.path.exists(fp_fragment):
+        return fragment_dict
+
+    with h5py.File(fp_fragment, 'r') as f:
+        for assignment_id in assignment_id_list:
+            key = str(int(assignment_id))
+            if key in f:
+                fragment_dict[int(assignment_id)] = f[key][()]
+    # Record access for eviction.
+    os.utime(fp_fragment)
+    return fragment_dict
+
+
+def save_fragments(fp_fragment, fragment_dict, max_byte=CACHE_MAX_BYTE):
+    """Add fragments to the cache.
+
+    Fragments that are already cached are left unchanged. Afterwards,
+    other projects are evicted if the cache exceeds `max_byte`.
+
+    Arguments:
+        fp_fragment: The file path of the cache file.
+        fragment_dict: A dictionary mapping assignment IDs to
+            fragments (or trial rows, see `to_fragment`).
+        max_byte (optional): The bound of the total cache size in
+            bytes.
+
+    """
+    if len(fragment_dict) == 0:
+        return
+    fp_cache = Path(fp_fragment).parent
+    if not os.path.exists(fp_cache):
+        os.makedirs(fp_cache)
+
+    with h5py.File(fp_fragment, 'a') as f:
+        for assignment_id, fragment in fragment_dict.items():
+            key = str(int(assignment_id))
+            if key in f:
+                continue
+            if not isinstance(fragment, np.ndarray):
+                fragment = to_fragment(fragment)
+            f.create_dataset(key, data=fragment)
+    evict(fp_cache, max_byte, keep=[fp_fragment])
+
+
+def evict(fp_cache, max_byte=CACHE_MAX_BYTE, keep=None):
+    """Evict least recently used projects.
+
+    Arguments:
+        fp_cache: The cache directory.
+        max_byte (optional): The bound of the total cache size in
+            bytes.
+        keep (optional): A list of cache files that are not evicted.
+
+    Returns:
+        evicted: A list of the evicted cache files.
+
+    """
+    keep = [Path(fp) for fp in (keep or [])]
+    fp_list = [
+        Path(fp_cache, fn) for fn in os.listdir(fp_cache)
+        if fn.endswith('.hdf5')
+    ]
+    n_byte = sum(os.path.getsize(fp) for fp in fp_list)
+
+    evicted = []
+    fp_list.sort(key=lambda fp: os.path.getmtime(fp))
+    for fp in fp_list:
+        if n_byte <= max_byte:
+            break
+        if fp in keep:
+            continue
+        n_byte = n_byte - os.path.getsize(fp)
+        os.remove(fp)
+        evicted.append(fp)
+    return evicted
+
+
+def clear_fragments(fp_fragment):
+    """Remove the cache file of a project.
+
+    Arguments:
+        fp_fragment: The file path of the cache file.
+
+    """
+    if os.path.exists(fp_fragment):
+        os.remove(fp_fragment)
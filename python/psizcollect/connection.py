@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 The PsiZ Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Module for establishing database connections.
+
+It is assumed that your MySQL credentials are stored at
+`~/.mysql/credentials` in the `psiz` block (see README), i.e.,
+
+```
+[psiz]
+servername = <host>
+username = <user>
+password = <password>
+database = <database>
+```
+
+Credentials are parsed once per file and section. Connections are
+handed out from a `mysql.connector.pooling.MySQLConnectionPool` that
+is created on first use, so repeated extractions within the same
+process do not pay for parsing and a new handshake every time. Each
+connection is checked before it is returned and reconnected if
+necessary. Calling `close()` on a pooled connection returns it to the
+pool.
+
+The backend can be replaced (see `set_backend`), for example with
+`sqlite_backend` in order to run against a local SQLite stand-in of
+the database.
+
+Functions:
+    read_credentials: Read (cached) database credentials.
+    get_connection: Get a healthy connection.
+    set_backend: Replace the connection backend.
+    clear_pool: Forget all connection pools.
+    mysql_backend: Default pooled MySQL backend.
+    sqlite_backend: SQLite stand-in backend.
+
+"""
+
+import configparser
+from pathlib import Path
+import sqlite3
+
+import mysql.connector.pooling
+
+SECTION = 'psiz'
+POOL_SIZE = 4
+
+_CREDENTIALS = {}
+_POOL = {}
+_BACKEND = None
+
+
+def read_credentials(fp_credentials=None, section=SECTION):
+    """Read database credentials.
+
+    The credentials file is only parsed the first time a particular
+    file and section are requested.
+
+    Arguments:
+        fp_credentials (optional): The file path of the credentials
+            file.
+        section (optional): The section of the credentials file.
+
+    Returns:
+        credentials: A dictionary of connection arguments.
+
+    """
+    if fp_credentials is None:
+        fp_credentials = Path.home() / Path('.mysql/credentials')
+    key = (str(fp_credentials), section)
+    if key not in _CREDENTIALS:
+        config = configparser.ConfigParser()
+        config.read(fp_credentials)
+        _CREDENTIALS[key] = {
+            'host': config[section]['servername'],
+            'user': config[section]['username'],
+            'passwd': config[section]['password'],
+            'database': config[section]['database']
+        }
+    return dict(_CREDENTIALS[key])
+
+
+def get_connection(fp_credentials=None, section=SECTION):
+    """Get a healthy database connection.
+
+    Arguments:
+        fp_credentials (optional): The file path of the credentials
+            file.
+        section (optional): The section of the credentials file.
+
+    Returns:
+        my_cxn: A database connection. Calling `close()` releases the
+            connection.
+
+    """
+    backend = _BACKEND
+    if backend is None:
+        backend = mysql_backend
+    return backend(fp_credentials, section)
+
+
+def set_backend(backend):
+    """Replace the connection backend.
+
+    Arguments:
+        backend: A callable with the signature
+            `backend(fp_credentials, section)` that returns a
+            connection. If None, the default MySQL backend is restored.
+
+    """
+    global _BACKEND
+    _BACKEND = backend
+
+
+def clear_pool():
+    """Forget all connection pools.
+
+    Should be called in a new (forked) process so that connections of
+    the parent process are not shared.
+
+    """
+    _POOL.clear()
+
+
+def mysql_backend(fp_credentials, section, pool_size=POOL_SIZE):
+    """Return a pooled MySQL connection.
+
+    Arguments:
+        fp_credentials: The file path of the credentials file.
+        section: The section of the credentials file.
+        pool_size (optional): The number of connections in the pool.
+
+    Returns:
+        my_cxn: A pooled MySQL connection.
+
+    """
+    credentials = read_credentials(fp_credentials, section)
+    key = (credentials['host'], credentials['database'], section)
+    if key not in _POOL:
+        _POOL[key] = mysql.connector.pooling.MySQLConnectionPool(
+            pool_name='psizcollect_{0}'.format(len(_POOL)),
+            pool_size=pool_size, pool_reset_session=True, **credentials
+        )
+    my_cxn = _POOL[key].get_connection()
+
+    # Health check, reconnect if the server closed the connection.
+    my_cxn.ping(reconnect=True, attempts=3, delay=1)
+    return my_cxn
+
+
+def sqlite_backend(database):
+    """Create a backend that connects to a SQLite database.
+
+    The SQLite database must contain `assignment` and `trial` tables
+    with the same columns as `sql/install_db_psiz.sql`. MySQL-style
+    `%s` placeholders are translated to SQLite placeholders.
+
+    Arguments:
+        database: The file path of the SQLite database.
+
+    Returns:
+        backend: A backend that can be passed to `set_backend`.
+
+    """
+    def backend(fp_credentials, section):
+        return SQLiteConnection(database)
+    return backend
+
+
+class SQLiteConnection(object):
+    """A MySQL-style wrapper around a SQLite connection."""
+
+    def __init__(self, database):
+        """Initialize.
+
+        Arguments:
+            database: The file path of the SQLite database.
+
+        """
+        self.cxn = sqlite3.connect(
+            database, detect_types=sqlite3.PARSE_DECLTYPES
+        )
+
+    def cursor(self, **kwargs):
+        """Return a cursor (MySQL cursor options are ignored)."""
+        return SQLiteCursor(self.cxn.cursor())
+
+    def commit(self):
+        """Commit the current transaction."""
+        self.cxn.commit()
+
+    def rollback(self):
+        """Roll back the current transaction."""
+        self.cxn.rollback()
+
+    def close(self):
+        """Close the connection."""
+        self.cxn.close()
+
+
+class SQLiteCursor(object):
+    """A MySQL-style wrapper around a SQLite cursor."""
+
+    def __init__(self, cursor):
+        """Initialize.
+
+        Arguments:
+            cursor: A sqlite3.Cursor object.
+
+        """
+        self.cursor = cursor
+
+    @property
+    def rowcount(self):
+        """The number of rows affected by the last statement."""
+        return self.cursor.rowcount
+
+    def execute(self, query, vals=()):
+        """Execute a query."""
+        self.cursor.execute(query.replace('%s', '?'), vals)
+
+    def executemany(self, query, vals):
+        """Execute a query for every set of values."""
+        self.cursor.executemany(query.replace('%s', '?'), vals)
+
+    def fetchall(self):
+        """Fetch all remaining rows."""
+        return self.cursor.fetchall()
+
+    def fetchmany(self, size):
+        """Fetch the next `size` rows."""
+        return self.cursor.fetchmany(size)
+
+    def close(self):
+        """Close the cursor."""
+        self.cursor.close()
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 The PsiZ Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Module for running extraction as a long-running daemon.
+
+The daemon keeps imports and (pooled) database connections warm and
+polls the `assignment` table of each project with a single cheap
+aggregate query. Only if the result of the query changed since the
+last extraction is `extract.extract_observations` run, appending new
+observations to the store and updating the summary incrementally.
+
+The polling interval adapts: it is reset to `interval_min` whenever
+new data was extracted and multiplied by `backoff` (up to
+`interval_max`) whenever nothing changed or an error occurred.
+
+The state of the daemon and the report of the last extraction of
+each project are written to a status file (by default
+`.psiz-collect/daemon_status.json`). A daemon does not start while
+the daemon recorded in the status file is still running.
+
+Usage:
+    python -m psizcollect.daemon <project_id> [<project_id> ...]
+
+Functions:
+    run: Run the daemon.
+    stop: Request the daemon to stop.
+    probe: Poll the assignment table of a project.
+    read_status: Read the status file.
+    is_running: Check if a daemon is running.
+
+"""
+
+import argparse
+from datetime import datetime
+import json
+import os
+from pathlib import Path
+import signal
+import threading
+import traceback
+
+import psizcollect.connection as pzc_connection
+import psizcollect.extract as pzc_extract
+
+FN_STATUS = 'daemon_status.json'
+
+_STOP = threading.Event()
+
+
+def run(
+        project_id_list, grade_mode='lenient', grade_threshold=.8,
+        interval_min=30., interval_max=900., backoff=2., n_iter=None,
+        fp_status=None, verbose=0, **kwargs):
+    """Run the daemon.
+
+    Arguments:
+        project_id_list: A list of project IDs.
+        grade_mode (optional): The grade mode to use when grading
+            catch trials.
+        grade_threshold (optional): The grading threshold to use for
+            determining if an assignment should be accepted or dropped.
+        interval_min (optional): The minimum polling interval in
+            seconds.
+        interval_max (optional): The maximum polling interval in
+            seconds.
+        backoff (optional): The factor by which the polling interval
+            grows while nothing changes.
+        n_iter (optional): The number of polls after which the daemon
+            stops. By default, the daemon runs until `stop` is called
+            or SIGTERM or SIGINT is received.
+        fp_status (optional): The file path of the status file.
+        verbose (optional): Verbosity of output.
+        kwargs (optional): Additional keyword arguments passed to
+            `extract.extract_observations`.
+
+    Returns:
+        status: A dictionary describing the final state of the daemon.
+
+    """
+    if fp_status is None:
+        fp_status = Path.home() / Path('.psiz-collect', FN_STATUS)
+    if is_running(fp_status):
+        raise RuntimeError(
+            "A daemon is already running (pid {0}).".format(
+                read_status(fp_status)['pid']
+            )
+        )
+    _STOP.clear()
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop())
+        signal.signal(signal.SIGINT, lambda signum, frame: stop())
+
+    status = {
+        'pid': os.getpid(),
+        'started': str(datetime.now()),
+        'last_poll': None,
+        'n_poll': 0,
+        'interval_s': interval_min,
+        'project': {
+            project_id: {
+                'signature': None,
+                'n_run': 0,
+                'last_run': None,
+                'last_report': None,
+                'last_error': None
+            } for project_id in project_id_list
+        }
+    }
+    interval = interval_min
+    while not _STOP.is_set():
+        is_changed = False
+        is_error = False
+        for project_id in project_id_list:
+            project_status = status['project'][project_id]
+            try:
+                if _poll_project(
+                        project_id, project_status, grade_mode,
+                        grade_threshold, verbose, kwargs):
+                    is_changed = True
+                project_status['last_error'] = None
+            except Exception:
+                is_error = True
+                project_status['last_error'] = traceback.format_exc()
+                if verbose > 0:
+                    print(project_status['last_error'])
+
+        # Adapt polling interval.
+        if is_changed and not is_error:
+            interval = interval_min
+        else:
+            interval = min(interval * backoff, interval_max)
+
+        status['n_poll'] = status['n_poll'] + 1
+        status['last_poll'] = str(datetime.now())
+        status['interval_s'] = interval
+        _write_status(fp_status, status)
+
+        if n_iter is not None and status['n_poll'] >= n_iter:
+            break
+        _STOP.wait(interval)
+
+    status['stopped'] = str(datetime.now())
+    _write_status(fp_status, status)
+    return status
+
+
+def _poll_project(
+        project_id, project_status, grade_mode, grade_threshold, verbose,
+        kwargs):
+    """Extract observations of a project if its assignments changed."""
+    my_cxn = pzc_connection.get_connection(
+        section=kwargs.get('section', pzc_connection.SECTION)
+    )
+    try:
+        signature = probe(my_cxn, project_id)
+    finally:
+        my_cxn.close()
+    if signature == project_status['signature']:
+        return False
+
+    if verbose > 0:
+        print('{0} | {1} changed, extracting'.format(
+            str(datetime.now()), project_id
+        ))
+    report = pzc_extract.extract_observations(
+        project_id, grade_mode=grade_mode, grade_threshold=grade_threshold,
+        use_preexist=True, verbose=verbose, **kwargs
+    )
+    project_status['n_run'] = project_status['n_run'] + 1
+    project_status['last_run'] = str(datetime.now())
+    project_status['last_report'] = report
+
+    # The signature probed before extraction is recorded, so that
+    # assignments that change during extraction are picked up by the
+    # next poll. Status codes updated by the extraction itself also
+    # cause one more (incremental) run.
+    project_status['signature'] = signature
+    return report['n_assignment_new'] > 0
+
+
+def probe(my_cxn, project_id):
+    """Poll the assignment table of a project.
+
+    Arguments:
+        my_cxn: A connection to a MySQL database.
+        project_id: The requested project ID.
+
+    Returns:
+        signature: A list of `[status_code, n_assignment,
+            max_assignment_id]` for every status code. The signature
+            changes when assignments are created or change status.
+
+    """
+    my_cursor = my_cxn.cursor()
+    my_cursor.execute(
+        "SELECT status_code, COUNT(*), MAX(assignment_id) FROM assignment "
+        "WHERE project_id=%s GROUP BY status_code ORDER BY status_code",
+        (project_id,)
+    )
+    sql_result = my_cursor.fetchall()
+    my_cursor.close()
+    signature = [[int(v) for v in row] for row in sql_result]
+    return signature
+
+
+def stop():
+    """Request the daemon to stop after the current poll."""
+    _STOP.set()
+
+
+def read_status(fp_status=None):
+    """Read the status file.
+
+    Arguments:
+        fp_status (optional): The file path of the status file.
+
+    Returns:
+        status: A dictionary describing the state of the daemon or
+            None if the status file does not exist.
+
+    """
+    if fp_status is None:
+        fp_status = Path.home() / Path('.psiz-collect', FN_STATUS)
+    if not os.path.exists(fp_status):
+        return None
+    with open(fp_status, 'r') as f:
+        status = json.load(f)
+    return status
+
+
+def is_running(fp_status=None):
+    """Check if a daemon is running.
+
+    Arguments:
+        fp_status (optional): The file path of the status file.
+
+    Returns:
+        is_running: Boolean indicating if the daemon recorded in the
+            status file has not stopped and its process is alive.
+
+    """
+    status = read_status(fp_status)
+    if status is None or 'stopped' in status or 'pid' not in status:
+        return False
+    try:
+        os.kill(status['pid'], 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # The process exists but belongs to another user.
+        pass
+    return True
+
+
+def _write_status(fp_status, status):
+    """Atomically write the status file."""
+    fp_tmp = Path(str(fp_status) + '.tmp')
+    if not os.path.exists(Path(fp_status).parent):
+        os.makedirs(Path(fp_status).parent)
+    with open(fp_tmp, 'w') as f:
+        json.dump(status, f, indent=2)
+    os.replace(fp_tmp, fp_status)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('project_id', type=str, nargs='+')
+    parser.add_argument('--grade_mode', type=str, default='lenient')
+    parser.add_argument('--grade_threshold', type=float, default=.8)
+    parser.add_argument('--interval_min', type=float, default=30.)
+    parser.add_argument('--interval_max', type=float, default=900.)
+    parser.add_argument('--backoff', type=float, default=2.)
+    parser.add_argument('--meta_format', type=str, default='csv')
+    parser.add_argument('--stream', action='store_true')
+    parser.add_argument('--verbose', type=int, default=0)
+    args = parser.parse_args()
+    run(
+        args.project_id, grade_mode=args.grade_mode,
+        grade_threshold=args.grade_threshold,
+        interval_min=args.interval_min, interval_max=args.interval_max,
+        backoff=args.backoff, verbose=args.verbose,
+        meta_format=args.meta_format, stream=args.stream
+    )
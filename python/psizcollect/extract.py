@@ -17,34 +17,57 @@
 """Module for extracting observations from a MySQL database.
 
 It is assumed that your MySQL credentials are stored at
-`~/.mysql/credentials` in the `psiz` block (see README). If
-they are stored somewhere else, with a different format, the variable
-`fp_mysql_credentials`, `host`, `user`,`passwd`, and `db` need to be
-changed.
+`~/.mysql/credentials` in the `psiz` block (see README and
+psizcollect.connection).
 
 Functions:
     extract_observations:
+    extract_many:
+    regrade:
+    init_stats:
     filter_assignment:
+    load_extract_state:
+    save_extract_state:
+    load_agent_index:
+    save_agent_index:
+    assign_agent_id:
     fetch_assignment:
+    fetch_trial:
+    fetch_summary_meta:
+    summarize_observations:
     assemble_accepted_obs:
+    stream_accepted_obs:
     create_obs_agent:
+    init_obs_buffer:
+    append_obs_buffer:
+    finalize_obs_buffer:
     update_status:
+    update_status_batch:
+    fetch_status_match:
+    load_pending_status:
+    save_pending_status:
+    apply_pending_status:
 
 """
 
 import argparse
-import configparser
-import copy
+import concurrent.futures
+import contextlib
 from datetime import datetime
+import fcntl
+import json
 import os
 from pathlib import Path
+import time
 
-import mysql.connector
 import numpy as np
 import pandas as pd
 import psiz.trials
+import psizcollect.cache as pzc_cache
+import psizcollect.connection as pzc_connection
 import psizcollect.preprocess as pzc_preprocess
 import psizcollect.pipes
+import psizcollect.store as pzc_store
 
 # Consants used/assumed in the MySQL database.
 STATUS_CREATED = 0  # Incomplete and not expired.
@@ -53,10 +76,24 @@ STATUS_EXPIRED = 2  # Incomplete and expired.
 STATUS_DROPPED = 3  # Completed but did not meet grading criteria.
 N_MAX_REF = 8
 
+# Maximum number of assignment IDs placed in a single trial query.
+TRIAL_CHUNK_SIZE = 1000
+# Maximum number of assignment IDs placed in a single status update.
+UPDATE_CHUNK_SIZE = 1000
+# Default number of trials fetched and written at a time when streaming.
+STREAM_CHUNK_SIZE = 50000
+# Status changes planned in read-only mode.
+FN_PENDING = 'pending_status.json'
+# Lock file serializing runs that modify the files of a project.
+FN_LOCK = 'extract.lock'
+
 
 def extract_observations(
         project_id, grade_mode="lenient", grade_threshold=.8,
-        use_preexist=True, verbose=0):
+        use_preexist=True, verbose=0, stream=False,
+        chunk_size=STREAM_CHUNK_SIZE, meta_format='csv',
+        write_metrics=False, read_only=False,
+        section=pzc_connection.SECTION, use_cache=False):
     """Extract and process observations from MySQL database.
 
     Data stored in a MySQL database is extracted and processed into
@@ -86,6 +123,44 @@ def extract_observations(
     summary is generated (summary.txt). The metadata file can be used
     to map agent ID's back to the MySQL database's assignment IDs.
 
+    When appending to pre-existing data, the incremental extraction
+    state (extract_state.json) records the highest assignment ID seen
+    and the status of assignments that were still in progress or had
+    expired without any trials. Only assignments with a higher ID, or
+    such open assignments whose status has since changed (e.g., an
+    expired assignment that was submitted after all), are requested
+    from the database. The
+    worker-to-agent index (agent_index.txt) maps each worker ID to a
+    persistent agent ID and counts each worker's sessions, so that
+    returning workers keep the same agent ID across runs.
+
+    New observations are appended in place to obs_dirty.hdf5 rather
+    than loading and rewriting all pre-existing observations (see
+    psizcollect.store). In streaming mode, trials are read and graded
+    in chunks (see `stream_accepted_obs`) and each chunk is appended as
+    it is completed. Runs that modify the same project (including
+    `regrade` and `apply_pending_status`) wait for each other using
+    the lock file `extract.lock` in the project directory.
+
+    In read-only mode, the database is never written to. The same
+    observations and metadata are created, but planned status changes
+    are merged into `pending_status.json` in the project directory.
+    The extraction can then run against a replica or snapshot (see
+    `section`) and the pending changes can be applied to the primary
+    database later in one batch (see `apply_pending_status`).
+
+    If `use_cache=True`, the raw trials of completed assignments are
+    read from and added to a local cache (see psizcollect.cache). For
+    example, regrading with `use_preexist=False` then only fetches
+    trials of assignments that are not yet cached. The cache is not
+    used in streaming mode.
+
+    Every assignment is graded in all grade modes at once. The grades
+    are recorded in the metadata columns `grade_lenient`,
+    `grade_strict` and `grade_partial`, so that a different grade mode
+    can be inspected without extracting again. The column `grade` and
+    the acceptance of an assignment follow `grade_mode`.
+
     Arguments:
         project_id: String indicating project ID. This should
         correspond to a string used in the `project_id` column of the
@@ -98,92 +173,809 @@ def extract_observations(
         use_preexist (optional): Append new observations to pre-existing
             data. Otherwise remake observations object from scratch.
         verbose (optional): Verbosity of output.
+        stream (optional): Boolean indicating if streaming mode should
+            be used. Peak memory is then bounded by `chunk_size`
+            instead of the size of the project.
+        chunk_size (optional): The number of trials fetched and
+            written at a time in streaming mode.
+        meta_format (optional): The storage format of the metadata.
+            Either 'csv' (meta.txt) or 'hdf5' (meta.hdf5, see
+            psizcollect.store). When using 'hdf5', new rows are
+            appended in place and meta.txt is kept as a plain-text
+            export. When using 'csv', an existing meta.hdf5 is
+            rewritten along with meta.txt.
+        write_metrics (optional): Boolean indicating if the report
+            should be appended as a JSON line to `metrics.jsonl` in
+            the project directory.
+        read_only (optional): Boolean indicating if status changes
+            should be written to `pending_status.json` instead of
+            the database.
+        section (optional): The section of the credentials file used
+            to connect, e.g., a section describing a replica.
+        use_cache (optional): Boolean indicating if the local cache
+            of raw trials should be used.
+
+    Returns:
+        report: A dictionary summarizing the run, containing the
+            number of newly extracted assignments (`n_assignment_new`)
+            and trials (`n_trial_new`), the number of assignment rows
+            whose status code was updated in the database
+            (`n_status_updated`), the total duration (`duration_s`)
+            and per-stage statistics (`stage`, see `init_stats`).
 
     """
+    if meta_format not in ('csv', 'hdf5'):
+        raise ValueError(
+            "The argument `meta_format` must be 'csv' or 'hdf5'."
+        )
+    time_start = time.perf_counter()
     is_new_data = True
-    fp_mysql_credentials = Path.home() / Path('.mysql/credentials')
+    stats = init_stats()
+    report = {
+        'n_assignment_new': 0, 'n_trial_new': 0, 'n_status_updated': 0
+    }
     fp_app = Path.home() / Path('.psiz-collect')
 
     # Set the project path.
     fp_project = fp_app / Path('projects', project_id)
     if not os.path.exists(fp_project):
         os.makedirs(fp_project)
-    fp_obs = fp_project / Path("obs_dirty.hdf5")
     fp_meta = fp_project / Path("meta.txt")
     fp_summary = fp_project / Path("summary.txt")
+    fp_state = fp_project / Path("extract_state.json")
+    fp_agent = fp_project / Path("agent_index.txt")
+    fp_meta_hdf5 = fp_project / Path(pzc_store.FN_META)
+    fp_metrics = fp_project / Path("metrics.jsonl")
+    fp_pending = fp_project / Path(FN_PENDING)
+    fp_fragment = None
+    if use_cache:
+        fp_fragment = pzc_cache.get_fragment_path(project_id)
 
-    # Establish MySQL connection using stored credentials.
-    config = configparser.ConfigParser()
-    config.read(fp_mysql_credentials)
-    my_cxn = mysql.connector.connect(
-        host=config['psiz']['servername'],
-        user=config['psiz']['username'],
-        passwd=config['psiz']['password'],
-        database=config['psiz']['database']
-    )
+    # Serialize runs that modify the files of the project.
+    with _lock_project(fp_project):
+        meta_pre = None
+        state = None
+        agent_index = {}
+        is_meta_append = False
+        if use_preexist:
+            # Load pre-existing metadata, extraction state and
+            # worker-to-agent index.
+            time_stage = time.perf_counter()
+            try:
+                if meta_format == 'hdf5':
+                    meta_pre = pzc_store.load_meta(fp_project)
+                if meta_pre is None:
+                    meta_pre = psizcollect.pipes.read_metadata(fp_meta)
+                else:
+                    is_meta_append = True
+                state = load_extract_state(fp_state, meta_pre)
+                agent_index = load_agent_index(fp_agent, meta_pre)
+            except Exception:
+                meta_pre = None
+                is_meta_append = False
+                state = None
+                agent_index = {}
+            _add_stats(
+                stats, 'load_preexist', time.perf_counter() - time_stage,
+                n_row=(0 if meta_pre is None else len(meta_pre.index))
+            )
 
-    # Retrieve assignment_id's of all participants in the database.
-    df_assignment = fetch_assignment(my_cxn, project_id)
+        status_change = None
+        status_pre = None
+        if read_only:
+            status_change = {}
+            status_pre = {}
 
-    obs_pre = None
-    meta_pre = None
-    max_agent_id = 0
-    if use_preexist:
-        # Load pre-existing observations and metadata.
+        # Discard observations staged by an interrupted run, as well as
+        # observations it committed without saving the metadata that
+        # refers to them.
+        pzc_store.rollback_obs(fp_project)
+        if meta_pre is not None:
+            pzc_store.reconcile_obs(fp_project, meta_pre['session_id'].values)
         try:
-            obs_pre = psiz.trials.load_trials(fp_obs)
-            meta_pre = pd.read_csv(fp_meta)
-            max_agent_id = np.max(obs_pre.agent_id)
-            df_assignment = filter_assignment(df_assignment, meta_pre)
+            # Get (pooled) MySQL connection using stored credentials.
+            my_cxn = pzc_connection.get_connection(section=section)
+            try:
+                time_stage = time.perf_counter()
+                if state is None:
+                    # Retrieve assignment_id's of all participants in the
+                    # database.
+                    df_assignment = fetch_assignment(my_cxn, project_id)
+                else:
+                    # Retrieve only assignments that are new or were in
+                    # progress.
+                    open_id_list = list(state['open_assignment'].keys())
+                    df_assignment = fetch_assignment(
+                        my_cxn, project_id,
+                        min_assignment_id=state['max_assignment_id'],
+                        assignment_id_list=open_id_list
+                    )
+                _add_stats(
+                    stats, 'fetch_assignment',
+                    time.perf_counter() - time_stage,
+                    n_row=len(df_assignment.index)
+                )
+                session_pre = None
+                if state is not None:
+                    (df_assignment, meta_pre, session_pre) = _filter_changed(
+                        df_assignment, meta_pre, state
+                    )
+                    if len(session_pre) > 0:
+                        is_meta_append = False
+
+                # Create psiz.trials.RankObservations object and meta data.
+                obs = None
+                if len(df_assignment.index) > 0:
+                    if meta_pre is None:
+                        # Remove stale observations when remaking from scratch.
+                        pzc_store.clear_obs(fp_project)
+                    if stream:
+                        meta, n_status_updated = stream_accepted_obs(
+                            my_cxn, df_assignment, grade_mode, grade_threshold,
+                            lambda x: _append_obs(fp_project, x, stats),
+                            agent_index=agent_index, chunk_size=chunk_size,
+                            verbose=verbose, stats=stats,
+                            status_change=status_change, status_pre=status_pre,
+                            session_pre=session_pre
+                        )
+                    else:
+                        obs, meta, n_status_updated = assemble_accepted_obs(
+                            my_cxn, df_assignment, grade_mode, grade_threshold,
+                            agent_index=agent_index, verbose=verbose,
+                            stats=stats, status_change=status_change,
+                            status_pre=status_pre, fp_fragment=fp_fragment,
+                            session_pre=session_pre
+                        )
+                else:
+                    is_new_data = False
+            finally:
+                # Release the MySQL connection.
+                my_cxn.close()
+
+            if is_new_data:
+                report['n_assignment_new'] = len(meta.index)
+                report['n_trial_new'] = int(np.sum(meta['n_trial'].values))
+                report['n_status_updated'] = n_status_updated
+
+                # Append new observations to the store and commit them before
+                # the metadata that refers to them is saved. Should saving
+                # the metadata fail, the next run trims them again.
+                if obs is not None:
+                    _append_obs(fp_project, obs, stats)
+                pzc_store.commit_obs(fp_project)
+
+                # Save metadata.
+                time_stage = time.perf_counter()
+                n_byte_pre = _file_size(fp_meta) + _file_size(fp_meta_hdf5)
+                is_append = (
+                    meta_format == 'hdf5' and is_meta_append and
+                    os.path.exists(fp_meta) and
+                    set(meta_pre.columns) == set(meta.columns)
+                )
+                if is_append:
+                    # Append new rows in place, including the plain-text
+                    # export.
+                    pzc_store.append_meta(fp_project, meta)
+                    psizcollect.pipes.write_metadata(
+                        meta, fp_meta, append=True
+                    )
+                if meta_pre is not None:
+                    # Combine new metadata with pre-existing metadata. The
+                    # summary is then based on metadata and the stored unique
+                    # stimuli since the combined observations are not loaded.
+                    obs = None
+                    meta = pd.concat([meta_pre, meta], ignore_index=True)
+                if not is_append:
+                    # Columnar metadata is refreshed in 'csv' mode as well,
+                    # since `regrade` and 'hdf5' runs prefer it.
+                    if meta_format == 'hdf5' or os.path.exists(fp_meta_hdf5):
+                        pzc_store.save_meta(fp_project, meta)
+                    psizcollect.pipes.write_metadata(meta, fp_meta)
+                    n_byte_pre = 0
+                _add_stats(
+                    stats, 'save_meta', time.perf_counter() - time_stage,
+                    n_row=report['n_assignment_new'],
+                    n_byte=(
+                        _file_size(fp_meta) + _file_size(fp_meta_hdf5) -
+                        n_byte_pre
+                    )
+                )
+
+                # Save extraction state.
+                time_stage = time.perf_counter()
+                save_extract_state(fp_state, meta)
+                save_agent_index(fp_agent, agent_index)
+                if status_change is not None:
+                    save_pending_status(fp_pending, status_change, status_pre)
+                _add_stats(
+                    stats, 'save_state', time.perf_counter() - time_stage,
+                    n_byte=_file_size(fp_state) + _file_size(fp_agent)
+                )
+
+                # Checkpoint the observations now that the metadata and
+                # extraction state that refer to them have been saved.
+                pzc_store.checkpoint_obs(fp_project)
+
+                # Save summary.
+                time_stage = time.perf_counter()
+                n_stimulus = None
+                if obs is None:
+                    stimulus_id = pzc_store.load_stimulus(fp_project)
+                    if stimulus_id is not None:
+                        n_stimulus = len(stimulus_id)
+                psizcollect.pipes.write_summary(
+                    obs, meta, fp_summary, n_stimulus=n_stimulus
+                )
+                _add_stats(
+                    stats, 'save_summary', time.perf_counter() - time_stage,
+                    n_byte=_file_size(fp_summary)
+                )
         except Exception:
-            pass
+            # Discard staged observations of the failed run so that they
+            # are not duplicated when its assignments are extracted again.
+            # Committed observations are kept since saved metadata may
+            # already refer to them.
+            pzc_store.rollback_obs(fp_project)
+            raise
+
+    report['duration_s'] = time.perf_counter() - time_start
+    report['stage'] = stats['stage']
+    if write_metrics:
+        _write_metrics(fp_metrics, project_id, report)
+    return report
+
+
+@contextlib.contextmanager
+def _lock_project(fp_project):
+    """Hold an exclusive lock on the files of a project.
+
+    Blocks until concurrent runs on the same project (e.g., by the
+    daemon and `psizcollect.pipes.update_obs_on_host`) have released
+    the lock. The lock is also released if the process dies.
+
+    """
+    if not os.path.exists(fp_project):
+        os.makedirs(fp_project)
+    with open(Path(fp_project, FN_LOCK), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def init_stats():
+    """Initialize per-stage extraction statistics.
+
+    Statistics are recorded for the stages: `load_preexist`,
+    `fetch_assignment`, `fetch_trial`, `load_cache`, `save_cache`,
+    `create_obs`, `grade`, `assemble`, `save_obs`, `save_meta`,
+    `save_summary` and `save_state`. Each stage records the wall time
+    in seconds (`time_s`), the number of rows (assignments or trials)
+    processed (`n_row`) and the number of bytes written (`n_byte`).
+
+    Returns:
+        stats: A dictionary of statistics.
+
+    """
+    return {'stage': {}}
+
+
+def _add_stats(stats, stage, time_s, n_row=0, n_byte=0):
+    """Accumulate statistics of a stage."""
+    if stats is None:
+        return
+    entry = stats['stage'].setdefault(
+        stage, {'time_s': 0., 'n_row': 0, 'n_byte': 0}
+    )
+    entry['time_s'] = entry['time_s'] + time_s
+    entry['n_row'] = entry['n_row'] + int(n_row)
+    entry['n_byte'] = entry['n_byte'] + int(n_byte)
+
+
+def _append_obs(fp_project, obs, stats):
+    """Stage observations in the store and record statistics."""
+    time_stage = time.perf_counter()
+    fp_obs = fp_project / Path(pzc_store.FN_OBS)
+    n_byte_pre = _file_size(fp_obs)
+    pzc_store.append_obs(fp_project, obs, stage=True)
+    _add_stats(
+        stats, 'save_obs', time.perf_counter() - time_stage,
+        n_row=obs.n_trial, n_byte=_file_size(fp_obs) - n_byte_pre
+    )
+
+
+def _file_size(fp):
+    """Return size of file in bytes (zero if it does not exist)."""
+    if os.path.exists(fp):
+        return os.path.getsize(fp)
+    return 0
+
 
-    # Create psiz.trials.RankObservations object and meta data.
-    if len(df_assignment.index) > 0:
-        obs, meta = assemble_accepted_obs(
-            my_cxn, df_assignment, grade_mode, grade_threshold, max_agent_id
+def _write_metrics(fp_metrics, project_id, report):
+    """Append report as a JSON line to the metrics file."""
+    record = {
+        'time': datetime.now().isoformat(),
+        'project_id': project_id
+    }
+    record.update(report)
+    with open(fp_metrics, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+
+def extract_many(project_id_list, workers=4, **kwargs):
+    """Extract observations for multiple projects concurrently.
+
+    Each project is extracted in a separate process (see
+    `extract_observations`) using its own database connection and
+    project directory. A project that is slow or fails does not block
+    or abort the remaining projects.
+
+    Arguments:
+        project_id_list: A list of project IDs.
+        workers (optional): The maximum number of worker processes.
+        kwargs (optional): Additional keyword arguments passed to
+            `extract_observations`.
+
+    Returns:
+        report: A dictionary mapping each project ID to a dictionary
+            with the keys `status` ('success' or 'failure'),
+            `duration_s`, `n_assignment_new`, `n_trial_new`,
+            `n_status_updated` and `error` (None or a description of
+            the failure). Successful projects also include per-stage
+            statistics (`stage`).
+
+    """
+    report = {}
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=pzc_connection.clear_pool) as executor:
+        future_dict = {
+            executor.submit(_extract_worker, project_id, kwargs): project_id
+            for project_id in project_id_list
+        }
+        for future in concurrent.futures.as_completed(future_dict):
+            project_id = future_dict[future]
+            try:
+                report[project_id] = future.result()
+            except Exception as e:
+                # E.g., the worker process terminated abruptly.
+                report[project_id] = {
+                    'status': 'failure', 'duration_s': np.nan,
+                    'n_assignment_new': 0, 'n_trial_new': 0,
+                    'n_status_updated': 0, 'error': repr(e)
+                }
+    return report
+
+
+def _extract_worker(project_id, kwargs):
+    """Extract a single project and report the outcome."""
+    time_start = time.perf_counter()
+    try:
+        report = extract_observations(project_id, **kwargs)
+        report['status'] = 'success'
+        report['error'] = None
+    except Exception as e:
+        report = {
+            'status': 'failure', 'n_assignment_new': 0, 'n_trial_new': 0,
+            'n_status_updated': 0, 'error': repr(e)
+        }
+    report['duration_s'] = time.perf_counter() - time_start
+    return report
+
+
+def regrade(
+        project_id, grade_mode="lenient", grade_threshold=.8, verbose=0):
+    """Regrade extracted observations without the database.
+
+    The stored observations (including catch trials) and metadata of a
+    project are graded again in a single pass. The `grade`,
+    `grade_<mode>`, `is_accepted` and `status_code` metadata columns
+    and the weights of the observations are updated and saved along
+    with a new summary. Resulting status changes (to ACCEPTED or
+    DROPPED) are merged into `pending_status.json` and can be applied
+    to the database later (see `apply_pending_status`).
+
+    Arguments:
+        project_id: String indicating project ID.
+        grade_mode (optional): The grade mode to use when grading
+            catch trials. See psizcollect.preprocess.grade_catch_trials.
+        grade_threshold (optional): The grading threshold to use for
+            determining if an assignment should be accepted or dropped.
+        verbose (optional): Verbosity of output.
+
+    Returns:
+        report: A dictionary summarizing the run, containing the
+            number of accepted (`n_accepted`) and dropped
+            (`n_dropped`) assignments, the status changes
+            (`status_change`) and the duration (`duration_s`).
+
+    """
+    time_start = time.perf_counter()
+    fp_project = Path.home() / Path('.psiz-collect', 'projects', project_id)
+    fp_meta = fp_project / Path("meta.txt")
+    fp_summary = fp_project / Path("summary.txt")
+    fp_pending = fp_project / Path(FN_PENDING)
+
+    with _lock_project(fp_project):
+        obs = pzc_store.load_obs(fp_project)
+        meta = pzc_store.load_meta(fp_project)
+        is_meta_hdf5 = meta is not None
+        if not is_meta_hdf5:
+            meta = psizcollect.pipes.read_metadata(fp_meta)
+        if obs is None:
+            raise ValueError(
+                "No observations of project `{0}` exist.".format(project_id)
+            )
+
+        # Map every trial to its assignment (session) in the metadata.
+        n_assignment = len(meta.index)
+        idx_meta = pd.Index(meta['assignment_id'].values).get_indexer(
+            obs.session_id
         )
-    else:
-        is_new_data = False
+        if np.any(idx_meta < 0):
+            raise ValueError(
+                "The observations contain sessions that are not in the "
+                "metadata."
+            )
 
-    # Close the MySQL connection.
-    my_cxn.close()
+        # Grade all catch trials at once in every grade mode and reduce
+        # per assignment.
+        (is_catch, score) = pzc_preprocess.score_catch_trials(obs)
+        if grade_mode not in score:
+            raise ValueError((
+                "The argument `grade_mode` must be 'strict', 'partial' or"
+                " 'lenient'."
+            ))
+        n_catch = np.bincount(idx_meta[is_catch], minlength=n_assignment)
+        locs_catch = n_catch > 0
+        grade_dict = {}
+        for mode, grade_catch in score.items():
+            score_sum = np.bincount(
+                idx_meta[is_catch], weights=grade_catch[is_catch],
+                minlength=n_assignment
+            )
+            grade_dict[mode] = np.full([n_assignment], np.nan)
+            grade_dict[mode][locs_catch] = (
+                score_sum[locs_catch] / n_catch[locs_catch]
+            )
+        grade = grade_dict[grade_mode]
 
-    if is_new_data:
-        if obs_pre is not None:
-            # Combine new data with pre-existing data.
-            obs = psiz.trials.stack((obs_pre, obs))
-            meta = pd.concat([meta_pre, meta], ignore_index=True)
+        # Accept or drop completed assignments.
+        status_code = meta['status_code'].values.astype(int)
+        locs_completed = np.logical_and(
+            np.logical_or(
+                np.equal(status_code, STATUS_ACCEPTED),
+                np.equal(status_code, STATUS_DROPPED)
+            ),
+            np.greater(meta['n_trial'].values, 0)
+        )
+        # Note that assignments without catch trials are accepted.
+        locs_dropped = np.logical_and(locs_completed, grade < grade_threshold)
+        locs_accepted = np.logical_and(
+            locs_completed, np.logical_not(locs_dropped)
+        )
+        status_code_new = status_code.copy()
+        status_code_new[locs_accepted] = STATUS_ACCEPTED
+        status_code_new[locs_dropped] = STATUS_DROPPED
+        locs_changed = np.not_equal(status_code, status_code_new)
+        assignment_id = meta['assignment_id'].values
+        status_change = {
+            STATUS_ACCEPTED: [
+                int(i) for i in assignment_id[
+                    np.logical_and(locs_changed, locs_accepted)
+                ]
+            ],
+            STATUS_DROPPED: [
+                int(i) for i in assignment_id[
+                    np.logical_and(locs_changed, locs_dropped)
+                ]
+            ]
+        }
+
+        meta = meta.copy()
+        meta.loc[locs_completed, 'grade'] = grade[locs_completed]
+        for mode in grade_dict:
+            meta.loc[locs_completed, 'grade_' + mode] = (
+                grade_dict[mode][locs_completed]
+            )
+        meta.loc[locs_completed, 'n_catch'] = n_catch[locs_completed]
+        meta['status_code'] = status_code_new
+        meta.loc[locs_completed, 'is_accepted'] = locs_accepted[locs_completed]
+        obs.weight = grade[idx_meta]
 
-        # Save observations, metadata, and summary.
-        obs.save(fp_obs)
+        pzc_store.save_obs(fp_project, obs)
+        if is_meta_hdf5:
+            pzc_store.save_meta(fp_project, meta)
         psizcollect.pipes.write_metadata(meta, fp_meta)
         psizcollect.pipes.write_summary(obs, meta, fp_summary)
+        status_pre = {
+            int(i): int(code) for i, code in zip(
+                assignment_id[locs_changed], status_code[locs_changed]
+            )
+        }
+        save_pending_status(fp_pending, status_change, status_pre)
+
+    report = {
+        'n_accepted': int(np.sum(locs_accepted)),
+        'n_dropped': int(np.sum(locs_dropped)),
+        'status_change': status_change,
+        'duration_s': time.perf_counter() - time_start
+    }
+    if verbose > 0:
+        print(
+            '    Regraded {0} assignment(s) | {1} accepted | {2} dropped | '
+            '{3} status change(s) pending'.format(
+                int(np.sum(locs_completed)), report['n_accepted'],
+                report['n_dropped'], int(np.sum(locs_changed))
+            )
+        )
+    return report
+
+
+def _filter_changed(df_assignment, meta_pre, state):
+    """Filter assignments down to new or changed assignments.
+
+    In-progress assignments whose status has changed are removed from
+    the pre-existing metadata so that they are re-extracted. Their
+    agent ID and session count are returned so that they are kept.
+
+    Returns:
+        df_assignment: The assignments that should be extracted.
+        meta_pre: The pre-existing metadata without changed
+            assignments.
+        session_pre: A dictionary mapping the assignment ID of each
+            removed assignment to a tuple `(agent_id, session_count)`.
+
+    """
+    # Compare against the status recorded in the pre-existing metadata,
+    # which the extraction state may lag behind after an interruption.
+    locs_open = meta_pre['assignment_id'].isin(
+        list(state['open_assignment'].keys())
+    ).values
+    status_pre = dict(zip(
+        meta_pre['assignment_id'].values[locs_open].tolist(),
+        meta_pre['status_code'].values[locs_open].tolist()
+    ))
+    changed_id_list = [
+        assignment_id for assignment_id, status_code in zip(
+            df_assignment['assignment_id'].values.tolist(),
+            df_assignment['status_code'].values.tolist()
+        )
+        if status_pre.get(assignment_id, status_code) != status_code
+    ]
+    locs_changed = meta_pre['assignment_id'].isin(changed_id_list).values
+    session_pre = dict(zip(
+        meta_pre['assignment_id'].values[locs_changed].tolist(),
+        zip(
+            meta_pre['agent_id'].values[locs_changed].tolist(),
+            meta_pre['session_count'].values[locs_changed].tolist()
+        )
+    ))
+    meta_pre = meta_pre[np.logical_not(locs_changed)]
+    df_assignment = filter_assignment(df_assignment, meta_pre)
+    return df_assignment, meta_pre, session_pre
 
 
 def filter_assignment(df_assignment, meta_pre):
-    """Filter assignments down to new assignments not in metadata."""
+    """Filter assignments down to new assignments not in metadata.
+
+    Arguments:
+        df_assignment: A pandas.DataFrame of assignments.
+        meta_pre: A pandas.DataFrame object containing pre-existing
+            metadata.
+
+    Returns:
+        df_assignment: The subset of assignments (in the original
+            order) that do not appear in the metadata.
+
+    """
     assignment_id_set_pre = meta_pre['assignment_id'].values
-    assignmnet_id_set = df_assignment['assignment_id'].values
-    # Identify new assignment IDs
-    assignment_id_set_new = np.setdiff1d(
-        assignmnet_id_set, assignment_id_set_pre, assume_unique=False
-    )
-    locs = np.zeros([len(df_assignment.index)], dtype=bool)
-    for assignment_id_new in assignment_id_set_new:
-        locs = np.logical_or(
-            locs, np.equal(assignmnet_id_set, assignment_id_new)
-        )
+    assignment_id_set = df_assignment['assignment_id'].values
+    # Identify new assignment IDs using a single set-membership pass.
+    locs = np.logical_not(np.isin(assignment_id_set, assignment_id_set_pre))
     df_assignment = df_assignment[locs]
     return df_assignment
 
 
-def fetch_assignment(my_cxn, project_id):
+def load_extract_state(fp_state, meta_pre):
+    """Load incremental extraction state.
+
+    If a state file does not exist or does not match the pre-existing
+    metadata (e.g., because an interrupted run saved the metadata but
+    not the state), the state is derived from the pre-existing
+    metadata.
+
+    Arguments:
+        fp_state: The file path of the extraction state file.
+        meta_pre: A pandas.DataFrame object containing pre-existing
+            metadata.
+
+    Returns:
+        state: A dictionary with the keys `max_assignment_id` (the
+            highest assignment ID seen) and `open_assignment` (a
+            dictionary mapping the IDs of in-progress assignments and
+            of expired assignments without trials to their last seen
+            status code).
+
+    """
+    state = None
+    if os.path.exists(fp_state):
+        with open(fp_state, 'r') as f:
+            state_json = json.load(f)
+        state = {
+            'max_assignment_id': int(state_json['max_assignment_id']),
+            'open_assignment': {
+                int(k): int(v)
+                for k, v in state_json['open_assignment'].items()
+            }
+        }
+    state_meta = _create_extract_state(meta_pre)
+    if (
+        state is None or
+        state['max_assignment_id'] != state_meta['max_assignment_id']
+    ):
+        state = state_meta
+    return state
+
+
+def save_extract_state(fp_state, meta):
+    """Save incremental extraction state.
+
+    Arguments:
+        fp_state: The file path of the extraction state file.
+        meta: A pandas.DataFrame object containing all metadata.
+
+    """
+    state = _create_extract_state(meta)
+    state_json = {
+        'max_assignment_id': state['max_assignment_id'],
+        'open_assignment': {
+            str(k): v for k, v in state['open_assignment'].items()
+        }
+    }
+    with open(fp_state, 'w') as f:
+        json.dump(state_json, f)
+
+
+def _create_extract_state(meta):
+    """Create incremental extraction state from metadata."""
+    assignment_id_arr = meta['assignment_id'].values.astype(int)
+    status_arr = meta['status_code'].values.astype(int)
+    # Expired assignments without trials are kept open since they can
+    # still be submitted, which sets their status to ACCEPTED.
+    is_open = np.logical_or(
+        np.equal(status_arr, STATUS_CREATED),
+        np.logical_and(
+            np.equal(status_arr, STATUS_EXPIRED),
+            np.equal(meta['n_trial'].values, 0)
+        )
+    )
+    if len(assignment_id_arr) > 0:
+        max_assignment_id = int(np.max(assignment_id_arr))
+    else:
+        max_assignment_id = 0
+    state = {
+        'max_assignment_id': max_assignment_id,
+        'open_assignment': dict(zip(
+            assignment_id_arr[is_open].tolist(),
+            status_arr[is_open].tolist()
+        ))
+    }
+    return state
+
+
+def load_agent_index(fp_agent, meta_pre):
+    """Load the worker-to-agent index.
+
+    If an index file does not exist or its session counts do not add
+    up to the number of pre-existing assignments, the index is derived
+    from the pre-existing metadata.
+
+    Arguments:
+        fp_agent: The file path of the agent index file.
+        meta_pre: A pandas.DataFrame object containing pre-existing
+            metadata.
+
+    Returns:
+        agent_index: A dictionary mapping each worker ID to a list
+            `[agent_id, n_session]`.
+
+    """
+    agent_index = None
+    if os.path.exists(fp_agent):
+        df_agent = pd.read_csv(fp_agent, dtype={'worker_id': str})
+        agent_index = {
+            worker_id: [int(agent_id), int(n_session)]
+            for worker_id, agent_id, n_session in zip(
+                df_agent['worker_id'].values, df_agent['agent_id'].values,
+                df_agent['n_session'].values
+            )
+        }
+        n_session = sum(v[1] for v in agent_index.values())
+        if n_session != len(meta_pre.index):
+            agent_index = None
+    if agent_index is None:
+        agent_index = {}
+        for worker_id, agent_id in zip(
+                meta_pre['worker_id'].values, meta_pre['agent_id'].values):
+            if worker_id in agent_index:
+                agent_index[worker_id][0] = int(agent_id)
+                agent_index[worker_id][1] += 1
+            else:
+                agent_index[worker_id] = [int(agent_id), 1]
+    return agent_index
+
+
+def save_agent_index(fp_agent, agent_index):
+    """Save the worker-to-agent index.
+
+    Arguments:
+        fp_agent: The file path of the agent index file.
+        agent_index: A dictionary mapping each worker ID to a list
+            `[agent_id, n_session]`.
+
+    """
+    df_agent = pd.DataFrame.from_dict({
+        'worker_id': list(agent_index.keys()),
+        'agent_id': [v[0] for v in agent_index.values()],
+        'n_session': [v[1] for v in agent_index.values()]
+    })
+    df_agent.to_csv(fp_agent, index=False)
+
+
+def assign_agent_id(worker_id_list, agent_index):
+    """Assign agent IDs and session counts to assignments.
+
+    Workers already in the index keep their agent ID. New workers
+    receive agent IDs greater than any existing agent ID, in order of
+    first appearance. The index is updated in place.
+
+    Arguments:
+        worker_id_list: The worker ID of each assignment.
+        agent_index: A dictionary mapping each worker ID to a list
+            `[agent_id, n_session]`.
+
+    Returns:
+        agent_id: The agent ID of each assignment.
+        session_count: The number of previous sessions of the worker
+            for each assignment.
+
+    """
+    n_assignment = len(worker_id_list)
+    agent_id = np.zeros([n_assignment], dtype=int)
+    session_count = np.zeros([n_assignment], dtype=int)
+
+    if len(agent_index) > 0:
+        next_agent_id = max(v[0] for v in agent_index.values()) + 1
+    else:
+        next_agent_id = 0
+
+    for idx, worker_id in enumerate(worker_id_list):
+        entry = agent_index.get(worker_id)
+        if entry is None:
+            entry = [next_agent_id, 0]
+            agent_index[worker_id] = entry
+            next_agent_id += 1
+        agent_id[idx] = entry[0]
+        session_count[idx] = entry[1]
+        entry[1] += 1
+
+    return agent_id, session_count
+
+
+def fetch_assignment(
+        my_cxn, project_id, min_assignment_id=None,
+        assignment_id_list=None):
     """Fetch data in assignment table.
 
     Arguments:
         my_cxn: A connection to a MySQL database.
         project_id: The requested project ID.
+        min_assignment_id (optional): If provided, only assignments
+            with an ID greater than this value are fetched.
+        assignment_id_list (optional): Additional assignment IDs that
+            are fetched regardless of `min_assignment_id`.
 
     Returns:
         df_assignment: All of the assignment table information
@@ -195,6 +987,15 @@ def fetch_assignment(my_cxn, project_id):
         "begin_hit, end_hit, ver FROM assignment WHERE project_id=%s"
     )
     vals = (project_id,)
+    if min_assignment_id is not None:
+        condition = "assignment_id>%s"
+        vals = vals + (int(min_assignment_id),)
+        if assignment_id_list:
+            condition = "({0} OR assignment_id IN ({1}))".format(
+                condition, ", ".join(["%s"] * len(assignment_id_list))
+            )
+            vals = vals + tuple(int(i) for i in assignment_id_list)
+        query_assignment = query_assignment + " AND " + condition
     my_cursor = my_cxn.cursor()
     my_cursor.execute(query_assignment, vals)
     sql_result = my_cursor.fetchall()
@@ -240,40 +1041,569 @@ def fetch_assignment(my_cxn, project_id):
     return df_assignment
 
 
+def fetch_trial(
+        my_cxn, assignment_id_list, chunk_size=TRIAL_CHUNK_SIZE,
+        stats=None, fp_fragment=None):
+    """Fetch data in trial table for a set of assignments.
+
+    Rather than issuing one query per assignment, trials are requested
+    for a chunk of assignments at a time using an IN-list. The rows
+    are then split by assignment in memory.
+
+    If a cache file is provided, cached assignments are loaded from
+    local disk and only the remaining assignments are requested.
+
+    Arguments:
+        my_cxn: A connection to a MySQL database.
+        assignment_id_list: The requested assignment IDs.
+        chunk_size (optional): The maximum number of assignment IDs
+            included in a single query.
+        stats (optional): Statistics to update (see `init_stats`).
+        fp_fragment (optional): The file path of a cache file (see
+            psizcollect.cache).
+
+    Returns:
+        trial_dict: A dictionary mapping each assignment ID to a list
+            of trial rows (ordered by `trial_id`). Assignments without
+            any trials are not included. Cached assignments map to a
+            fragment (see psizcollect.cache.to_fragment) instead.
+
+    """
+    assignment_id_list = [int(i) for i in assignment_id_list]
+
+    trial_dict = {}
+    if fp_fragment is not None:
+        time_start = time.perf_counter()
+        trial_dict = pzc_cache.load_fragments(fp_fragment, assignment_id_list)
+        assignment_id_list = [
+            i for i in assignment_id_list if i not in trial_dict
+        ]
+        _add_stats(
+            stats, 'load_cache', time.perf_counter() - time_start,
+            n_row=sum(len(v) for v in trial_dict.values())
+        )
+
+    time_start = time.perf_counter()
+    n_row = 0
+    for idx_start in range(0, len(assignment_id_list), chunk_size):
+        chunk = assignment_id_list[idx_start:idx_start + chunk_size]
+        my_cursor = my_cxn.cursor()
+        my_cursor.execute(_query_trial(len(chunk)), tuple(chunk))
+        sql_result = my_cursor.fetchall()
+        my_cursor.close()
+
+        n_row = n_row + len(sql_result)
+        for row in sql_result:
+            trial_dict.setdefault(row[1], []).append(row)
+
+    _add_stats(
+        stats, 'fetch_trial', time.perf_counter() - time_start, n_row=n_row
+    )
+    return trial_dict
+
+
+def _query_trial(n_assignment):
+    """Return trial query for `n_assignment` assignment IDs."""
+    query_trial = (
+        "SELECT trial_id, assignment_id, n_select, is_ranked, q_idx, "
+        "c1_idx, c2_idx, c3_idx, c4_idx, c5_idx, c6_idx, c7_idx, c8_idx, "
+        "start_ms, c1_rt_ms, c2_rt_ms, c3_rt_ms, c4_rt_ms, c5_rt_ms, "
+        "c6_rt_ms, c7_rt_ms, c8_rt_ms, submit_rt_ms "
+        "FROM trial WHERE assignment_id IN ({0}) "
+        "ORDER BY assignment_id, trial_id"
+    ).format(", ".join(["%s"] * n_assignment))
+    return query_trial
+
+
+def fetch_summary_meta(my_cxn, project_id, grade_mode='lenient'):
+    """Fetch per-assignment aggregates computed by the database.
+
+    Trials are aggregated with a single `GROUP BY` query, including
+    the grading of catch trials, so no trial rows are transferred.
+    The returned metadata has the columns used by
+    `psizcollect.pipes.write_summary`. Agent IDs are not persistent,
+    they only distinguish workers within the returned metadata.
+
+    Arguments:
+        my_cxn: A connection to a MySQL database.
+        project_id: The requested project ID.
+        grade_mode (optional): The grade mode to use when grading
+            catch trials. See
+            psizcollect.preprocess.grade_catch_trials.
+
+    Returns:
+        meta: A pandas.DataFrame object with one row per assignment.
+
+    """
+    my_cursor = my_cxn.cursor()
+    my_cursor.execute(_query_summary(grade_mode), (project_id,))
+    sql_result = my_cursor.fetchall()
+    my_cursor.close()
+
+    n_assignment = len(sql_result)
+    columns = list(zip(*sql_result))
+    if n_assignment == 0:
+        columns = [[]] * 10
+    begin_hit = columns[4]
+    end_hit = columns[5]
+    duration_hit_min = np.array([
+        (end_hit[idx] - begin_hit[idx]).total_seconds() / 60.
+        for idx in range(n_assignment)
+    ])
+    n_trial = np.array(columns[6], dtype=int)
+    avg_trial_rt = np.array(
+        [np.nan if v is None else float(v) for v in columns[7]]
+    )
+    n_catch = np.array(
+        [0 if v is None else int(v) for v in columns[8]], dtype=int
+    )
+    score = np.array(
+        [0. if v is None else float(v) for v in columns[9]]
+    )
+    grade = np.full([n_assignment], np.nan)
+    locs_catch = n_catch > 0
+    grade[locs_catch] = score[locs_catch] / n_catch[locs_catch]
+    status_code = np.array(columns[3], dtype=int)
+
+    meta = pd.DataFrame.from_dict({
+        'assignment_id': np.array(columns[0], dtype=int),
+        'worker_id': np.array(columns[1], dtype=object),
+        'agent_id': pd.factorize(np.array(columns[1], dtype=object))[0],
+        'protocol_id': np.array(columns[2], dtype=object),
+        'status_code': status_code,
+        'duration_hit_min': duration_hit_min,
+        'avg_trial_rt': avg_trial_rt,
+        'n_trial': n_trial,
+        'n_catch': n_catch,
+        'grade': grade,
+        'is_accepted': np.equal(status_code, STATUS_ACCEPTED)
+    })
+    return meta
+
+
+def _query_summary(grade_mode):
+    """Return per-assignment aggregate query for `grade_mode`."""
+    # Score of a selected copy of the query that is not the first choice.
+    if grade_mode == 'lenient':
+        score_other = "1"
+    elif grade_mode == 'strict':
+        score_other = "CASE WHEN t.is_ranked<>0 THEN 0 ELSE 1 END"
+    elif grade_mode == 'partial':
+        score_other = "CASE WHEN t.is_ranked<>0 THEN 0.5 ELSE 1 END"
+    else:
+        raise ValueError((
+            "The argument `grade_mode` must be 'strict', 'partial' or"
+            " 'lenient'."
+        ))
+    is_catch = " OR ".join([
+        "t.c{0}_idx=t.q_idx".format(i_ref)
+        for i_ref in range(1, N_MAX_REF + 1)
+    ])
+    is_selected = " OR ".join([
+        "(t.n_select>={0} AND t.c{0}_idx=t.q_idx)".format(i_ref)
+        for i_ref in range(1, N_MAX_REF + 1)
+    ])
+    query_summary = (
+        "SELECT a.assignment_id, a.worker_id, a.protocol_id, "
+        "a.status_code, a.begin_hit, a.end_hit, COUNT(t.trial_id), "
+        "AVG(t.submit_rt_ms), "
+        "SUM(CASE WHEN {0} THEN 1 ELSE 0 END), "
+        "SUM(CASE WHEN t.c1_idx=t.q_idx THEN 1 "
+        "WHEN {1} THEN {2} ELSE 0 END) "
+        "FROM assignment AS a "
+        "LEFT JOIN trial AS t ON t.assignment_id=a.assignment_id "
+        "WHERE a.project_id=%s "
+        "GROUP BY a.assignment_id ORDER BY a.assignment_id"
+    ).format(is_catch, is_selected, score_other)
+    return query_summary
+
+
+def summarize_observations(
+        project_id, grade_mode='lenient', fp_summary=None,
+        section=pzc_connection.SECTION):
+    """Write a summary of a project using database-side aggregates.
+
+    Unlike `extract_observations`, no trials are transferred and no
+    RankObservations object is created. The database is not written
+    to. The summary therefore reflects the status codes currently
+    stored in the database.
+
+    Arguments:
+        project_id: String indicating project ID.
+        grade_mode (optional): The grade mode to use when grading
+            catch trials.
+        fp_summary (optional): The file path of the summary file. By
+            default, `summary.txt` in the project directory is used.
+        section (optional): The section of the credentials file used
+            to connect.
+
+    Returns:
+        meta: A pandas.DataFrame object with one row per assignment
+            (see `fetch_summary_meta`).
+
+    """
+    if fp_summary is None:
+        fp_project = Path.home() / Path(
+            '.psiz-collect', 'projects', project_id
+        )
+        if not os.path.exists(fp_project):
+            os.makedirs(fp_project)
+        fp_summary = fp_project / Path("summary.txt")
+
+    my_cxn = pzc_connection.get_connection(section=section)
+    try:
+        meta = fetch_summary_meta(my_cxn, project_id, grade_mode=grade_mode)
+    finally:
+        my_cxn.close()
+    psizcollect.pipes.write_summary(None, meta, fp_summary)
+    return meta
+
+
 def assemble_accepted_obs(
-        my_cxn, df_assignment, grade_mode, grade_thresh, max_agent_id):
+        my_cxn, df_assignment, grade_mode, grade_thresh, agent_index=None,
+        verbose=0, stats=None, status_change=None, status_pre=None,
+        fp_fragment=None, session_pre=None):
     """Create RankObservations object for accepted data.
 
+    Status changes are only written for assignments whose status code
+    in the database still equals the status code that was fetched.
+
     Arguments:
         my_cxn: A connection to a MySQL database.
         df_assignment: A dictionary representing information in the
             assignment table.
         grade_mode: The mode of grading to use.
         grade_thresh: The threshold to use for dropping an assignment.
-        max_agent_id: Integer indicating the maximum existing agent ID.
-            All new agent IDs must be greater than this integer.
+        agent_index (optional): A dictionary mapping each worker ID
+            to a list `[agent_id, n_session]`. The index is updated in
+            place. See `assign_agent_id`.
+        verbose (optional): Verbosity of output.
+        stats (optional): Statistics to update (see `init_stats`).
+        status_change (optional): A dictionary mapping a status code
+            to a list of assignment IDs. If provided, the planned
+            status changes are added to this dictionary instead of
+            being written to the database, i.e., the connection is
+            only read from.
+        status_pre (optional): A dictionary mapping an assignment ID
+            to its status code. If provided along with
+            `status_change`, the fetched status code of each planned
+            change is added to this dictionary.
+        fp_fragment (optional): The file path of a cache file (see
+            psizcollect.cache). Cached trials are not fetched and the
+            fetched trials of completed assignments are cached.
+        session_pre (optional): A dictionary mapping an assignment ID
+            to a tuple `(agent_id, session_count)`. These assignments
+            keep their agent ID and session count instead of being
+            assigned new ones (see `assign_agent_id`).
 
     Returns:
         obs: An psiz.trials.RankObservations object.
         df_meta: A companion dataframe containing metadata about the
             observations.
+        n_status_updated: The number of assignment rows whose status
+            code was updated in the database (zero if `status_change`
+            is provided).
+
+    """
+    dict_meta = _init_meta(df_assignment, agent_index, session_pre)
+
+    # Fetch trials for all assignments using chunked bulk queries.
+    trial_dict = fetch_trial(
+        my_cxn, dict_meta["assignment_id"], stats=stats,
+        fp_fragment=fp_fragment
+    )
+    if fp_fragment is not None:
+        _cache_completed(fp_fragment, dict_meta, trial_dict, stats)
+
+    # Preallocate observation arrays using the known trial counts.
+    time_assemble = 0.
+    time_stage = time.perf_counter()
+    n_trial_max = np.sum([len(v) for v in trial_dict.values()], dtype=int)
+    obs_buffer = init_obs_buffer(n_trial_max)
+    n_trial_buffer = 0
+    time_assemble = time_assemble + time.perf_counter() - time_stage
+
+    # Status changes are collected and applied in a single transaction.
+    status_plan = {STATUS_DROPPED: [], STATUS_EXPIRED: []}
+    status_plan_pre = {}
+
+    for idx, assignment_id in enumerate(dict_meta["assignment_id"]):
+        sql_result = trial_dict.get(int(assignment_id), [])
+        obs_agent = _grade_assignment(
+            dict_meta, idx, sql_result, grade_mode, grade_thresh,
+            status_plan, status_plan_pre, stats=stats
+        )
+        if obs_agent is not None:
+            time_stage = time.perf_counter()
+            n_trial_buffer = append_obs_buffer(
+                obs_buffer, n_trial_buffer, obs_agent
+            )
+            time_assemble = time_assemble + time.perf_counter() - time_stage
+
+    n_status_updated = _apply_status_plan(
+        my_cxn, status_plan, status_plan_pre, status_change, status_pre,
+        verbose
+    )
+    if status_change is None:
+        _mark_expired(my_cxn, dict_meta, status_plan, n_status_updated)
+
+    time_stage = time.perf_counter()
+    obs = finalize_obs_buffer(obs_buffer, n_trial_buffer)
+    time_assemble = time_assemble + time.perf_counter() - time_stage
+    _add_stats(stats, 'assemble', time_assemble, n_row=n_trial_buffer)
+    # obs = pzc_preprocess.remove_catch_trials(obs)
+    df_meta = pd.DataFrame.from_dict(dict_meta)
+
+    return obs, df_meta, n_status_updated
+
+
+def stream_accepted_obs(
+        my_cxn, df_assignment, grade_mode, grade_thresh, write_chunk,
+        agent_index=None, chunk_size=STREAM_CHUNK_SIZE, verbose=0,
+        stats=None, status_change=None, status_pre=None,
+        session_pre=None):
+    """Create RankObservations chunks for accepted data.
+
+    Trials are read through an unbuffered (server-side) cursor,
+    `chunk_size` rows at a time. Each assignment is graded as soon as
+    all of its rows have been read. Once at least `chunk_size` trials
+    are pending, they are handed to `write_chunk` and released.
+
+    Peak memory is bounded by roughly `chunk_size` fetched rows plus
+    `chunk_size` pending trials (plus the largest single assignment),
+    in addition to one metadata row per assignment. It does not grow
+    with the total number of trials.
+
+    Arguments:
+        my_cxn: A connection to a MySQL database.
+        df_assignment: A dictionary representing information in the
+            assignment table.
+        grade_mode: The mode of grading to use.
+        grade_thresh: The threshold to use for dropping an assignment.
+        write_chunk: A callable that accepts a
+            psiz.trials.RankObservations object.
+        agent_index (optional): A dictionary mapping each worker ID
+            to a list `[agent_id, n_session]`. The index is updated in
+            place. See `assign_agent_id`.
+        chunk_size (optional): The number of trials fetched and
+            written at a time.
+        verbose (optional): Verbosity of output.
+        stats (optional): Statistics to update (see `init_stats`).
+        status_change (optional): A dictionary mapping a status code
+            to a list of assignment IDs. If provided, the planned
+            status changes are added to this dictionary instead of
+            being written to the database.
+        status_pre (optional): A dictionary mapping an assignment ID
+            to its status code. If provided along with
+            `status_change`, the fetched status code of each planned
+            change is added to this dictionary.
+        session_pre (optional): A dictionary mapping an assignment ID
+            to a tuple `(agent_id, session_count)`. These assignments
+            keep their agent ID and session count instead of being
+            assigned new ones (see `assign_agent_id`).
+
+    Returns:
+        df_meta: A companion dataframe containing metadata about the
+            observations.
+        n_status_updated: The number of assignment rows whose status
+            code was updated in the database (zero if `status_change`
+            is provided).
+
+    """
+    dict_meta = _init_meta(df_assignment, agent_index, session_pre)
+    idx_dict = {
+        int(assignment_id): idx
+        for idx, assignment_id in enumerate(dict_meta['assignment_id'])
+    }
+    is_done = np.zeros([len(idx_dict)], dtype=bool)
+
+    status_plan = {STATUS_DROPPED: [], STATUS_EXPIRED: []}
+    status_plan_pre = {}
+    pending = []
+    n_trial_pending = 0
+
+    def _finish_assignment(assignment_id, sql_result):
+        nonlocal n_trial_pending
+        idx = idx_dict[assignment_id]
+        is_done[idx] = True
+        obs_agent = _grade_assignment(
+            dict_meta, idx, sql_result, grade_mode, grade_thresh,
+            status_plan, status_plan_pre, stats=stats
+        )
+        if obs_agent is not None:
+            pending.append(obs_agent)
+            n_trial_pending = n_trial_pending + obs_agent.n_trial
+        if n_trial_pending >= chunk_size:
+            _flush()
+
+    def _flush():
+        nonlocal pending, n_trial_pending
+        if n_trial_pending > 0:
+            time_stage = time.perf_counter()
+            obs_chunk = psiz.trials.stack(pending)
+            _add_stats(
+                stats, 'assemble', time.perf_counter() - time_stage,
+                n_row=n_trial_pending
+            )
+            write_chunk(obs_chunk)
+        pending = []
+        n_trial_pending = 0
+
+    assignment_id_list = list(idx_dict.keys())
+    for idx_start in range(0, len(assignment_id_list), TRIAL_CHUNK_SIZE):
+        chunk = assignment_id_list[idx_start:idx_start + TRIAL_CHUNK_SIZE]
+        time_stage = time.perf_counter()
+        my_cursor = my_cxn.cursor(buffered=False)
+        my_cursor.execute(_query_trial(len(chunk)), tuple(chunk))
+        _add_stats(stats, 'fetch_trial', time.perf_counter() - time_stage)
+        current_id = None
+        current_rows = []
+        while True:
+            time_stage = time.perf_counter()
+            sql_result = my_cursor.fetchmany(chunk_size)
+            _add_stats(
+                stats, 'fetch_trial', time.perf_counter() - time_stage,
+                n_row=len(sql_result)
+            )
+            if not sql_result:
+                break
+            for row in sql_result:
+                if row[1] != current_id:
+                    if current_id is not None:
+                        _finish_assignment(current_id, current_rows)
+                    current_id = row[1]
+                    current_rows = []
+                current_rows.append(row)
+        if current_id is not None:
+            _finish_assignment(current_id, current_rows)
+        my_cursor.close()
+
+    # Assignments without any trials.
+    for idx in np.flatnonzero(np.logical_not(is_done)):
+        _grade_assignment(
+            dict_meta, idx, [], grade_mode, grade_thresh, status_plan,
+            status_plan_pre
+        )
+    _flush()
+
+    n_status_updated = _apply_status_plan(
+        my_cxn, status_plan, status_plan_pre, status_change, status_pre,
+        verbose
+    )
+    if status_change is None:
+        _mark_expired(my_cxn, dict_meta, status_plan, n_status_updated)
+
+    df_meta = pd.DataFrame.from_dict(dict_meta)
+    return df_meta, n_status_updated
+
+
+def _cache_completed(fp_fragment, dict_meta, trial_dict, stats):
+    """Add fetched trials of completed assignments to the cache."""
+    time_start = time.perf_counter()
+    fragment_dict = {}
+    for idx, assignment_id in enumerate(dict_meta['assignment_id']):
+        rows = trial_dict.get(int(assignment_id))
+        is_completed = (
+            dict_meta['status_code'][idx] == STATUS_ACCEPTED or
+            dict_meta['status_code'][idx] == STATUS_DROPPED
+        )
+        if is_completed and isinstance(rows, list):
+            fragment_dict[int(assignment_id)] = rows
+    pzc_cache.save_fragments(fp_fragment, fragment_dict)
+    _add_stats(
+        stats, 'save_cache', time.perf_counter() - time_start,
+        n_row=sum(len(v) for v in fragment_dict.values())
+    )
+
+
+def _apply_status_plan(
+        my_cxn, status_plan, status_plan_pre, status_change, status_pre,
+        verbose):
+    """Write planned status changes or add them to `status_change`.
+
+    Returns:
+        n_row: The number of rows affected in the database.
 
     """
+    n_row = 0
+    if status_change is None:
+        n_row = update_status_batch(
+            my_cxn, status_plan, status_pre=status_plan_pre
+        )
+        if verbose > 0:
+            print(
+                '      Updated status_code | {0} row(s) affected'.format(
+                    n_row
+                )
+            )
+    else:
+        for status_code, assignment_id_list in status_plan.items():
+            status_change.setdefault(status_code, []).extend(
+                int(i) for i in assignment_id_list
+            )
+        if status_pre is not None:
+            status_pre.update(status_plan_pre)
+        if verbose > 0:
+            print(
+                '      Planned status_code | {0} change(s)'.format(
+                    sum(len(v) for v in status_plan.values())
+                )
+            )
+    return n_row
+
+
+def _mark_expired(my_cxn, dict_meta, status_plan, n_row):
+    """Record applied EXPIRED status changes in metadata.
+
+    The incremental extraction state then records them as expired, so
+    that a later submission is detected as a status change. If fewer
+    rows were affected than planned (e.g., an assignment was completed
+    in the meantime), the database is queried for the assignments that
+    are now expired.
+
+    """
+    expired_id_list = [int(i) for i in status_plan[STATUS_EXPIRED]]
+    if len(expired_id_list) == 0:
+        return
+    if n_row < sum(len(v) for v in status_plan.values()):
+        expired_id_list = fetch_status_match(
+            my_cxn, expired_id_list, STATUS_EXPIRED
+        )
+    locs = np.isin(dict_meta['assignment_id'], expired_id_list)
+    dict_meta['status_code'][locs] = STATUS_EXPIRED
+
+
+def _init_meta(df_assignment, agent_index, session_pre=None):
+    """Initialize metadata for a set of assignments."""
     n_assignment = len(df_assignment["assignment_id"].values)
+    if agent_index is None:
+        agent_index = {}
+    if session_pre is None:
+        session_pre = {}
 
-    unique_worker_id_list = pd.unique(df_assignment["worker_id"].values)
-    n_unique_worker = len(unique_worker_id_list)
-    unique_agent_id_list = np.arange(n_unique_worker) + max_agent_id
-    agent_id_counter = np.zeros([n_unique_worker])
+    # Determine agent IDs and session IDs. Re-extracted assignments
+    # keep their previous values.
+    locs_pre = np.isin(
+        df_assignment["assignment_id"].values, list(session_pre.keys())
+    )
+    locs_new = np.logical_not(locs_pre)
+    agent_id_arr = np.zeros([n_assignment], dtype=int)
+    session_count_arr = np.zeros([n_assignment], dtype=int)
+    (agent_id_arr[locs_new], session_count_arr[locs_new]) = assign_agent_id(
+        df_assignment["worker_id"].values[locs_new], agent_index
+    )
+    for idx in np.flatnonzero(locs_pre):
+        assignment_id = int(df_assignment["assignment_id"].values[idx])
+        (agent_id_arr[idx], session_count_arr[idx]) = (
+            session_pre[assignment_id]
+        )
 
-    # Initialize.
-    obs = None
     dict_meta = {
         'assignment_id': df_assignment['assignment_id'].values,
         'worker_id': df_assignment['worker_id'].values,
-        'agent_id': np.zeros([n_assignment], dtype=int),
+        'agent_id': agent_id_arr,
         'session_id': df_assignment['assignment_id'].values,
-        'session_count': np.zeros([n_assignment], dtype=int),
+        'session_count': session_count_arr,
         'protocol_id': df_assignment['protocol_id'].values,
         'status_code': df_assignment['status_code'].values,
         'duration_hit_min': df_assignment['duration_hit_min'].values,
@@ -283,114 +1613,107 @@ def assemble_accepted_obs(
         'grade': np.zeros([n_assignment]),
         'is_accepted': np.zeros(n_assignment, dtype=bool)
     }
+    for grade_mode in pzc_preprocess.GRADE_MODE_LIST:
+        dict_meta['grade_' + grade_mode] = np.zeros([n_assignment])
+    return dict_meta
 
-    # Determine agent IDs and session IDs.
-    for idx, assignment_id in enumerate(dict_meta["assignment_id"]):
-        agent_loc = np.equal(
-            df_assignment["worker_id"].values[idx], unique_worker_id_list
-        )
-        agent_id = unique_agent_id_list[agent_loc]
-        dict_meta['agent_id'][idx] = agent_id
-        dict_meta['session_count'][idx] = copy.copy(agent_id_counter[agent_loc])
-        agent_id_counter[agent_loc] = agent_id_counter[agent_loc] + 1
 
-    query_trial = (
-        "SELECT trial_id, assignment_id, n_select, is_ranked, q_idx, "
-        "c1_idx, c2_idx, c3_idx, c4_idx, c5_idx, c6_idx, c7_idx, c8_idx, "
-        "start_ms, c1_rt_ms, c2_rt_ms, c3_rt_ms, c4_rt_ms, c5_rt_ms, "
-        "c6_rt_ms, c7_rt_ms, c8_rt_ms, submit_rt_ms "
-        "FROM trial WHERE assignment_id=%s"
-    )
+def _grade_assignment(
+        dict_meta, idx, sql_result, grade_mode, grade_thresh,
+        status_change, status_pre, stats=None):
+    """Grade a single assignment and record the outcome in metadata.
 
-    for idx, assignment_id in enumerate(dict_meta["assignment_id"]):
-        vals = (int(assignment_id),)
-        my_cursor = my_cxn.cursor()
-        my_cursor.execute(query_trial, vals)
-        sql_result = my_cursor.fetchall()
-        my_cursor.close()
+    Returns:
+        obs_agent: The graded observations of a completed assignment
+            or None if the assignment should not be added.
 
-        n_trial = len(sql_result)
-
-        if n_trial > 0:
-            agent_id = dict_meta['agent_id'][idx]
-            session_id = dict_meta['session_id'][idx]
-            obs_agent = create_obs_agent(sql_result, agent_id, session_id)
-            dict_meta['avg_trial_rt'][idx] = np.mean(obs_agent.rt_ms)
-            dict_meta['n_trial'][idx] = n_trial
-            (avg_grade, _, is_catch) = (
-                pzc_preprocess.grade_catch_trials(
-                    obs_agent, grade_mode=grade_mode
-                )
-            )
-            # Weight observations by average catch trial grade.
-            obs_agent.weight = avg_grade * np.ones([obs_agent.n_trial])
-            dict_meta['n_catch'][idx] = np.sum(is_catch)
-            dict_meta['grade'][idx] = avg_grade
-
-            # Accept or drop.
-            if (
-                dict_meta['status_code'][idx] == STATUS_ACCEPTED or
-                dict_meta['status_code'][idx] == STATUS_DROPPED
-            ):
-                if avg_grade < grade_thresh:
-                    dict_meta['is_accepted'][idx] = False
-                    update_status(my_cxn, assignment_id, STATUS_DROPPED)
-                    dict_meta['status_code'][idx] = STATUS_DROPPED
-                else:
-                    dict_meta['is_accepted'][idx] = True
-                    # update_status(my_cxn, assignment_id, STATUS_ACCEPTED)
-                    dict_meta['status_code'][idx] = STATUS_ACCEPTED
+    """
+    assignment_id = dict_meta['assignment_id'][idx]
+    n_trial = len(sql_result)
 
-                # Add obs, regardless of grade.
-                if obs is None:
-                    obs = obs_agent
-                else:
-                    obs = psiz.trials.stack((obs, obs_agent))
+    if n_trial == 0:
+        # Zero trials, mark as expired and incomplete assignment.
+        if dict_meta['status_code'][idx] == STATUS_CREATED:
+            status_change[STATUS_EXPIRED].append(assignment_id)
+            status_pre[int(assignment_id)] = STATUS_CREATED
+        return None
+
+    agent_id = dict_meta['agent_id'][idx]
+    session_id = dict_meta['session_id'][idx]
+    time_stage = time.perf_counter()
+    obs_agent = create_obs_agent(sql_result, agent_id, session_id)
+    _add_stats(
+        stats, 'create_obs', time.perf_counter() - time_stage, n_row=n_trial
+    )
+    dict_meta['avg_trial_rt'][idx] = np.mean(obs_agent.rt_ms)
+    dict_meta['n_trial'][idx] = n_trial
+    time_stage = time.perf_counter()
+    # Grade in all modes, the requested mode determines acceptance.
+    (is_catch, score) = pzc_preprocess.score_catch_trials(obs_agent)
+    if grade_mode not in score:
+        raise ValueError((
+            "The argument `grade_mode` must be 'strict', 'partial' or"
+            " 'lenient'."
+        ))
+    n_catch = np.sum(is_catch)
+    for mode, grade in score.items():
+        if n_catch > 0:
+            dict_meta['grade_' + mode][idx] = np.sum(grade[is_catch]) / n_catch
         else:
-            # Zero trials, mark as expired and incomplete assignment.
-            if dict_meta['status_code'][idx] == STATUS_CREATED:
-                update_status(my_cxn, assignment_id, STATUS_EXPIRED)
+            dict_meta['grade_' + mode][idx] = np.nan
+    avg_grade = dict_meta['grade_' + grade_mode][idx]
+    _add_stats(
+        stats, 'grade', time.perf_counter() - time_stage, n_row=n_trial
+    )
+    # Weight observations by average catch trial grade.
+    obs_agent.weight = avg_grade * np.ones([obs_agent.n_trial])
+    dict_meta['n_catch'][idx] = n_catch
+    dict_meta['grade'][idx] = avg_grade
 
-    # obs = pzc_preprocess.remove_catch_trials(obs)
-    df_meta = pd.DataFrame.from_dict(dict_meta)
+    # Accept or drop.
+    if (
+        dict_meta['status_code'][idx] == STATUS_ACCEPTED or
+        dict_meta['status_code'][idx] == STATUS_DROPPED
+    ):
+        if avg_grade < grade_thresh:
+            dict_meta['is_accepted'][idx] = False
+            if dict_meta['status_code'][idx] != STATUS_DROPPED:
+                status_change[STATUS_DROPPED].append(assignment_id)
+                status_pre[int(assignment_id)] = int(
+                    dict_meta['status_code'][idx]
+                )
+            dict_meta['status_code'][idx] = STATUS_DROPPED
+        else:
+            dict_meta['is_accepted'][idx] = True
+            # update_status(my_cxn, assignment_id, STATUS_ACCEPTED)
+            dict_meta['status_code'][idx] = STATUS_ACCEPTED
 
-    return obs, df_meta
+        # Add obs, regardless of grade.
+        return obs_agent
+    return None
 
 
 def create_obs_agent(sql_result, agent_id, session_id):
-    """Create Observations object for single agent."""
+    """Create Observations object for single agent.
+
+    The rows returned by the trial query are converted in a single
+    vectorized step and then sliced by column. Unused (NULL) choice
+    columns are filled with the placeholder -1.
+
+    """
     n_trial = len(sql_result)
 
+    # Convert all numeric columns at once, mapping NULL to NaN.
+    sql_array = np.array(sql_result, dtype=object)
+    n_select = sql_array[:, 2].astype(int)
+    is_ranked = sql_array[:, 3].astype(int)
+    response_set = sql_array[:, 4:(5 + N_MAX_REF)].astype(float)
+    response_set[np.isnan(response_set)] = -1
+    response_set = response_set.astype(int)
+    rt_submit_ms = sql_array[:, 22].astype(int)
+
     agent_id = agent_id * np.ones([n_trial], dtype=int)
     session_id = session_id * np.ones([n_trial], dtype=int)
-    response_set = -1 * np.ones([n_trial, 1 + N_MAX_REF], dtype=int)
-    n_select = np.ones([n_trial], dtype=int)
-    is_ranked = np.ones([n_trial], dtype=int)
-    rt_ms = np.zeros([n_trial, N_MAX_REF], dtype=int)
-    rt_submit_ms = np.zeros([n_trial], dtype=int)
-    for i_trial in range(n_trial):
-        response_set[i_trial, 0] = sql_result[i_trial][4]
-        response_set[i_trial, 1] = sql_result[i_trial][5]
-        response_set[i_trial, 2] = sql_result[i_trial][6]
-        response_set[i_trial, 3] = sql_result[i_trial][7]
-        response_set[i_trial, 4] = sql_result[i_trial][8]
-        response_set[i_trial, 5] = sql_result[i_trial][9]
-        response_set[i_trial, 6] = sql_result[i_trial][10]
-        response_set[i_trial, 7] = sql_result[i_trial][11]
-        response_set[i_trial, 8] = sql_result[i_trial][12]
-
-        n_select[i_trial] = sql_result[i_trial][2]
-        is_ranked[i_trial] = sql_result[i_trial][3]
-
-        rt_ms[i_trial, 0] = sql_result[i_trial][14]
-        rt_ms[i_trial, 1] = sql_result[i_trial][15]
-        rt_ms[i_trial, 2] = sql_result[i_trial][16]
-        rt_ms[i_trial, 3] = sql_result[i_trial][17]
-        rt_ms[i_trial, 4] = sql_result[i_trial][18]
-        rt_ms[i_trial, 5] = sql_result[i_trial][19]
-        rt_ms[i_trial, 6] = sql_result[i_trial][20]
-        rt_ms[i_trial, 7] = sql_result[i_trial][21]
-        rt_submit_ms[i_trial] = sql_result[i_trial][22]
 
     obs = psiz.trials.RankObservations(
         response_set, n_select=n_select, is_ranked=is_ranked,
@@ -399,6 +1722,79 @@ def create_obs_agent(sql_result, agent_id, session_id):
     return obs
 
 
+def init_obs_buffer(n_trial):
+    """Preallocate arrays for assembling observations.
+
+    Arguments:
+        n_trial: The maximum number of trials the buffer must hold.
+
+    Returns:
+        obs_buffer: A dictionary of preallocated arrays.
+
+    """
+    obs_buffer = {
+        'stimulus_set': -1 * np.ones([n_trial, 1 + N_MAX_REF], dtype=int),
+        'n_select': np.ones([n_trial], dtype=int),
+        'is_ranked': np.ones([n_trial], dtype=int),
+        'agent_id': np.zeros([n_trial], dtype=int),
+        'session_id': np.zeros([n_trial], dtype=int),
+        'weight': np.ones([n_trial]),
+        'rt_ms': np.zeros([n_trial], dtype=int)
+    }
+    return obs_buffer
+
+
+def append_obs_buffer(obs_buffer, n_trial_buffer, obs_agent):
+    """Copy observations into buffer.
+
+    Arguments:
+        obs_buffer: A dictionary of preallocated arrays.
+        n_trial_buffer: The number of trials already in the buffer.
+        obs_agent: A psiz.trials.RankObservations object.
+
+    Returns:
+        n_trial_buffer: The updated number of trials in the buffer.
+
+    """
+    idx_end = n_trial_buffer + obs_agent.n_trial
+    n_col = obs_agent.stimulus_set.shape[1]
+    obs_buffer['stimulus_set'][n_trial_buffer:idx_end, 0:n_col] = (
+        obs_agent.stimulus_set
+    )
+    for key in [
+            'n_select', 'is_ranked', 'agent_id', 'session_id', 'weight',
+            'rt_ms']:
+        obs_buffer[key][n_trial_buffer:idx_end] = getattr(obs_agent, key)
+    return idx_end
+
+
+def finalize_obs_buffer(obs_buffer, n_trial_buffer):
+    """Create a single RankObservations object from buffer.
+
+    Arguments:
+        obs_buffer: A dictionary of preallocated arrays.
+        n_trial_buffer: The number of trials in the buffer.
+
+    Returns:
+        obs: A psiz.trials.RankObservations object or None if the
+            buffer is empty.
+
+    """
+    if n_trial_buffer == 0:
+        return None
+
+    obs = psiz.trials.RankObservations(
+        obs_buffer['stimulus_set'][0:n_trial_buffer],
+        n_select=obs_buffer['n_select'][0:n_trial_buffer],
+        is_ranked=obs_buffer['is_ranked'][0:n_trial_buffer],
+        agent_id=obs_buffer['agent_id'][0:n_trial_buffer],
+        session_id=obs_buffer['session_id'][0:n_trial_buffer],
+        weight=obs_buffer['weight'][0:n_trial_buffer],
+        rt_ms=obs_buffer['rt_ms'][0:n_trial_buffer]
+    )
+    return obs
+
+
 def update_status(my_cxn, assignment_id, status_code):
     """Update the status code for a particular assignment.
 
@@ -407,19 +1803,216 @@ def update_status(my_cxn, assignment_id, status_code):
         assignment_id: The assignment to update.
         status_code: The status code to apply.
 
+    Returns:
+        n_row: The number of rows affected.
+
+    """
+    return update_status_batch(my_cxn, {status_code: [assignment_id]})
+
+
+def update_status_batch(my_cxn, status_change, status_pre=None):
+    """Update the status code of many assignments in one transaction.
+
+    One parameterized UPDATE is issued per status code and expected
+    current status code (and chunk of assignment IDs). All updates
+    are committed together, or rolled back if any update fails.
+
+    Arguments:
+        my_cxn: A connection to a MySQL database.
+        status_change: A dictionary mapping a status code to a list
+            of assignment IDs that should receive that status code.
+        status_pre (optional): A dictionary mapping an assignment ID
+            to its expected current status code. Such an assignment
+            is only updated if its status code in the database still
+            equals the expected status code. Assignments that are not
+            in the dictionary are updated unconditionally.
+
+    Returns:
+        n_row: The number of rows affected.
+
     """
-    # query = (
-    #     "SELECT status_code FROM assignment WHERE assignment_id={1:d}"
-    # ).format(assignment_id)
-    query = (
-        "UPDATE assignment SET status_code={0:d} WHERE assignment_id={1:d}"
-    ).format(status_code, assignment_id)
+    n_row = 0
+    if not any(len(v) > 0 for v in status_change.values()):
+        return n_row
+    if status_pre is None:
+        status_pre = {}
+
     my_cursor = my_cxn.cursor()
-    my_cursor.execute(query)
-    my_cxn.commit()
-    # print(
-    #     '      SET status_code={0:d} | {1} row(s) affected'.format(
-    #         status_code, my_cursor.rowcount
-    #     )
-    # )
+    try:
+        for status_code, assignment_id_list in status_change.items():
+            # Group assignments by their expected current status code.
+            group_dict = {}
+            for assignment_id in assignment_id_list:
+                group_dict.setdefault(
+                    status_pre.get(int(assignment_id)), []
+                ).append(int(assignment_id))
+            for code_pre, group in group_dict.items():
+                n_row = n_row + _update_status_group(
+                    my_cursor, status_code, code_pre, group
+                )
+        my_cxn.commit()
+    except Exception:
+        my_cxn.rollback()
+        raise
+    finally:
+        my_cursor.close()
+    return n_row
+
+
+def _update_status_group(my_cursor, status_code, code_pre, assignment_id_list):
+    """Update the status code of assignments with the same expectation.
+
+    Returns:
+        n_row: The number of rows affected.
+
+    """
+    n_row = 0
+    for idx_start in range(0, len(assignment_id_list), UPDATE_CHUNK_SIZE):
+        chunk = assignment_id_list[idx_start:idx_start + UPDATE_CHUNK_SIZE]
+        query = (
+            "UPDATE assignment SET status_code=%s "
+            "WHERE assignment_id IN ({0})"
+        ).format(", ".join(["%s"] * len(chunk)))
+        vals = (int(status_code),) + tuple(chunk)
+        if code_pre is not None:
+            query = query + " AND status_code=%s"
+            vals = vals + (int(code_pre),)
+        my_cursor.execute(query, vals)
+        n_row = n_row + my_cursor.rowcount
+    return n_row
+
+
+def fetch_status_match(my_cxn, assignment_id_list, status_code):
+    """Fetch the assignments that have a particular status code.
+
+    Arguments:
+        my_cxn: A connection to a MySQL database.
+        assignment_id_list: The requested assignment IDs.
+        status_code: The requested status code.
+
+    Returns:
+        assignment_id_list: The subset of requested assignment IDs
+            whose status code equals `status_code`.
+
+    """
+    assignment_id_list = [int(i) for i in assignment_id_list]
+    match_list = []
+    my_cursor = my_cxn.cursor()
+    for idx_start in range(0, len(assignment_id_list), UPDATE_CHUNK_SIZE):
+        chunk = assignment_id_list[idx_start:idx_start + UPDATE_CHUNK_SIZE]
+        query = (
+            "SELECT assignment_id FROM assignment "
+            "WHERE assignment_id IN ({0}) AND status_code=%s"
+        ).format(", ".join(["%s"] * len(chunk)))
+        my_cursor.execute(query, tuple(chunk) + (int(status_code),))
+        match_list.extend(int(row[0]) for row in my_cursor.fetchall())
     my_cursor.close()
+    return match_list
+
+
+def load_pending_status(fp_pending):
+    """Load status changes planned in read-only mode.
+
+    Arguments:
+        fp_pending: The file path of the pending status changes.
+
+    Returns:
+        status_change: A dictionary mapping a status code to a list
+            of assignment IDs. Empty if the file does not exist.
+        status_pre: A dictionary mapping an assignment ID to the
+            status code it had when the change was planned.
+
+    """
+    status_change = {}
+    status_pre = {}
+    if os.path.exists(fp_pending):
+        with open(fp_pending, 'r') as f:
+            pending = json.load(f)
+        for status_code, assignment_id_list in pending[
+                'status_change'].items():
+            status_change[int(status_code)] = [
+                int(i) for i in assignment_id_list
+            ]
+        status_pre = {
+            int(k): int(v) for k, v in pending['status_pre'].items()
+        }
+    return status_change, status_pre
+
+
+def save_pending_status(fp_pending, status_change, status_pre):
+    """Merge status changes into the pending status changes.
+
+    If an assignment already has a pending change, the new status
+    code replaces the old one, but the status code recorded for the
+    old change is kept, since the database has not changed since.
+
+    Arguments:
+        fp_pending: The file path of the pending status changes.
+        status_change: A dictionary mapping a status code to a list
+            of assignment IDs.
+        status_pre: A dictionary mapping an assignment ID to the
+            status code it had when the change was planned.
+
+    """
+    (status_change_pending, status_pre_pending) = load_pending_status(
+        fp_pending
+    )
+    status_dict = {}
+    for status_code, assignment_id_list in status_change_pending.items():
+        for assignment_id in assignment_id_list:
+            status_dict[assignment_id] = status_code
+    for status_code, assignment_id_list in status_change.items():
+        for assignment_id in assignment_id_list:
+            status_dict[int(assignment_id)] = int(status_code)
+    for assignment_id, status_code in status_pre.items():
+        status_pre_pending.setdefault(int(assignment_id), int(status_code))
+
+    pending = {'status_change': {}, 'status_pre': {}}
+    for assignment_id, status_code in sorted(status_dict.items()):
+        pending['status_change'].setdefault(str(status_code), []).append(
+            assignment_id
+        )
+        if assignment_id in status_pre_pending:
+            pending['status_pre'][str(assignment_id)] = (
+                status_pre_pending[assignment_id]
+            )
+    fp_tmp = Path(str(fp_pending) + '.tmp')
+    with open(fp_tmp, 'w') as f:
+        json.dump(pending, f)
+    os.replace(fp_tmp, fp_pending)
+
+
+def apply_pending_status(project_id, section=pzc_connection.SECTION):
+    """Apply status changes planned in read-only mode.
+
+    All pending status changes of a project are written in a single
+    transaction (see `update_status_batch`). An assignment is only
+    updated if its status code still equals the status code it had
+    when the change was planned. The pending file is removed once the
+    transaction has been committed.
+
+    Arguments:
+        project_id: String indicating project ID.
+        section (optional): The section of the credentials file used
+            to connect to the (primary) database.
+
+    Returns:
+        n_row: The number of rows affected.
+
+    """
+    fp_project = Path.home() / Path('.psiz-collect', 'projects', project_id)
+    fp_pending = fp_project / Path(FN_PENDING)
+    with _lock_project(fp_project):
+        (status_change, status_pre) = load_pending_status(fp_pending)
+        if len(status_change) == 0:
+            return 0
+
+        my_cxn = pzc_connection.get_connection(section=section)
+        try:
+            n_row = update_status_batch(
+                my_cxn, status_change, status_pre=status_pre
+            )
+        finally:
+            my_cxn.close()
+        os.remove(fp_pending)
+    return n_row
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 The PsiZ Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Module for versioned changes to the database schema.
+
+The base schema is created by `sql/install_db_psiz.sql` (version 0).
+Each entry of `MIGRATIONS` brings the schema to the next version. The
+applied versions are recorded in the `schema_version` table. Applying
+a migration is idempotent: objects that already exist are skipped, so
+a migration that was interrupted can simply be applied again.
+
+Version 1 adds the indexes used by the most frequent queries:
+    * `assignment (project_id, status_code)`: Protocol selection in
+      `initialize.php` (`retrieveProtocolHistory`) and the status
+      summary of a project.
+    * `assignment (project_id, assignment_id)`: `fetch_assignment`,
+      including incremental extraction of assignments beyond the
+      highest assignment ID seen so far.
+    * `trial (assignment_id, trial_id)`: `fetch_trial`. MySQL already
+      indexes the foreign key `assignment_id`; the composite index
+      replaces that implicit index and also serves the ordering.
+
+Usage:
+    python -m psizcollect.migrate [--target <version>] [--verify]
+
+Functions:
+    get_version: Get the current schema version.
+    migrate: Apply pending migrations.
+    verify: Verify that the schema matches a version.
+    list_index: List the indexes of a table.
+    explain: Return the query plan of a query.
+
+"""
+
+import argparse
+
+import psizcollect.connection as pzc_connection
+
+MIGRATIONS = [
+    {
+        'version': 1,
+        'description': 'Add indexes for extraction and protocol selection.',
+        'index': [
+            (
+                'assignment', 'idx_assignment_project_status',
+                ('project_id', 'status_code')
+            ),
+            (
+                'assignment', 'idx_assignment_project_id',
+                ('project_id', 'assignment_id')
+            ),
+            (
+                'trial', 'idx_trial_assignment',
+                ('assignment_id', 'trial_id')
+            ),
+        ]
+    },
+]
+
+QUERY_VERSION_TABLE = (
+    "CREATE TABLE IF NOT EXISTS schema_version ("
+    "version INT NOT NULL PRIMARY KEY, "
+    "description CHAR(255) NOT NULL, "
+    "applied TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+)
+
+
+def get_version(my_cxn):
+    """Get the current schema version.
+
+    Arguments:
+        my_cxn: A connection to a MySQL database.
+
+    Returns:
+        version: The highest applied schema version (0 if no
+            migration has been applied).
+
+    """
+    my_cursor = my_cxn.cursor()
+    my_cursor.execute(QUERY_VERSION_TABLE)
+    my_cursor.execute("SELECT MAX(version) FROM schema_version")
+    sql_result = my_cursor.fetchall()
+    my_cursor.close()
+    my_cxn.commit()
+
+    version = sql_result[0][0]
+    if version is None:
+        version = 0
+    return int(version)
+
+
+def migrate(my_cxn=None, target=None, verbose=0):
+    """Apply pending migrations.
+
+    Arguments:
+        my_cxn (optional): A connection to a MySQL database. If not
+            provided, a connection is obtained from
+            psizcollect.connection and released afterwards.
+        target (optional): The schema version to migrate to. By
+            default, all migrations are applied.
+        verbose (optional): Verbosity of output.
+
+    Returns:
+        version: The schema version after migrating.
+
+    """
+    is_own_cxn = my_cxn is None
+    if is_own_cxn:
+        my_cxn = pzc_connection.get_connection()
+    try:
+        version = get_version(my_cxn)
+        for migration in MIGRATIONS:
+            if migration['version'] <= version:
+                continue
+            if target is not None and migration['version'] > target:
+                break
+            _apply_migration(my_cxn, migration, verbose)
+            missing = verify(my_cxn, migration['version'])
+            if len(missing) > 0:
+                raise RuntimeError(
+                    "Migration {0} is missing: {1}".format(
+                        migration['version'], ', '.join(missing)
+                    )
+                )
+            version = migration['version']
+    finally:
+        if is_own_cxn:
+            my_cxn.close()
+    return version
+
+
+def _apply_migration(my_cxn, migration, verbose):
+    """Apply a single migration and record its version."""
+    if verbose > 0:
+        print('Migration {0}: {1}'.format(
+            migration['version'], migration['description']
+        ))
+    my_cursor = my_cxn.cursor()
+    try:
+        for (table, name, columns) in migration['index']:
+            if name in list_index(my_cxn, table):
+                if verbose > 0:
+                    print('    {0} exists, skipped'.format(name))
+                continue
+            my_cursor.execute(
+                "CREATE INDEX {0} ON {1} ({2})".format(
+                    name, table, ', '.join(columns)
+                )
+            )
+            if verbose > 0:
+                print('    {0} created'.format(name))
+        my_cursor.execute(
+            "INSERT INTO schema_version (version, description) "
+            "VALUES (%s, %s)",
+            (migration['version'], migration['description'])
+        )
+        my_cxn.commit()
+    except Exception:
+        my_cxn.rollback()
+        raise
+    finally:
+        my_cursor.close()
+
+
+def verify(my_cxn, version=None):
+    """Verify that the schema matches a version.
+
+    Arguments:
+        my_cxn: A connection to a MySQL database.
+        version (optional): The schema version to verify. By default,
+            the current schema version is verified.
+
+    Returns:
+        missing: A list of the schema objects that are missing. The
+            list is empty if the schema matches.
+
+    """
+    if version is None:
+        version = get_version(my_cxn)
+    missing = []
+    for migration in MIGRATIONS:
+        if migration['version'] > version:
+            break
+        for (table, name, columns) in migration['index']:
+            index_dict = list_index(my_cxn, table)
+            if index_dict.get(name) != list(columns):
+                missing.append('{0}.{1}'.format(table, name))
+    return missing
+
+
+def list_index(my_cxn, table):
+    """List the indexes of a table.
+
+    Arguments:
+        my_cxn: A connection to a MySQL database.
+        table: The name of the table.
+
+    Returns:
+        index_dict: A dictionary mapping each index name to the list
+            of indexed columns.
+
+    """
+    my_cursor = my_cxn.cursor()
+    if isinstance(my_cxn, pzc_connection.SQLiteConnection):
+        my_cursor.execute(
+            "SELECT il.name, ii.name FROM pragma_index_list(%s) AS il, "
+            "pragma_index_info(il.name) AS ii ORDER BY il.name, ii.seqno",
+            (table,)
+        )
+    else:
+        my_cursor.execute(
+            "SELECT index_name, column_name "
+            "FROM information_schema.statistics "
+            "WHERE table_schema=DATABASE() AND table_name=%s "
+            "ORDER BY index_name, seq_in_index",
+            (table,)
+        )
+    sql_result = my_cursor.fetchall()
+    my_cursor.close()
+
+    index_dict = {}
+    for (name, column) in sql_result:
+        index_dict.setdefault(name, []).append(column)
+    return index_dict
+
+
+def explain(my_cxn, query, vals=()):
+    """Return the query plan of a query.
+
+    Arguments:
+        my_cxn: A connection to a MySQL database.
+        query: The query.
+        vals (optional): The query parameters.
+
+    Returns:
+        plan: A list of rows describing the query plan.
+
+    """
+    if isinstance(my_cxn, pzc_connection.SQLiteConnection):
+        prefix = "EXPLAIN QUERY PLAN "
+    else:
+        prefix = "EXPLAIN "
+    my_cursor = my_cxn.cursor()
+    my_cursor.execute(prefix + query, vals)
+    plan = my_cursor.fetchall()
+    my_cursor.close()
+    return plan
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--target', type=int, default=None,
+        help='Schema version to migrate to.'
+    )
+    parser.add_argument(
+        '--verify', action='store_true',
+        help='Only verify the current schema version.'
+    )
+    args = parser.parse_args()
+
+    my_cxn = pzc_connection.get_connection()
+    try:
+        if args.verify:
+            version = get_version(my_cxn)
+            missing = verify(my_cxn, version)
+            print('Schema version {0}: {1}'.format(
+                version, 'ok' if len(missing) == 0 else
+                'missing ' + ', '.join(missing)
+            ))
+        else:
+            version = migrate(my_cxn, target=args.target, verbose=1)
+            print('Schema version {0}'.format(version))
+    finally:
+        my_cxn.close()
@@ -21,6 +21,8 @@ structure of `host_node` and `compute_node`.
 
 Functions:
     update_obs_on_host:
+    start_daemon_on_host:
+    read_metadata:
     write_metadata:
     write_summary:
     assignment_summary:
@@ -46,6 +48,7 @@ import numpy as np
 import pandas as pd
 import paramiko
 import psiz.trials
+import psizcollect.store as pzc_store
 
 # Consants used/assumed in the MySQL database.
 STATUS_CREATED = 0  # Incomplete and not expired.
@@ -93,6 +96,63 @@ def update_obs_on_host(
     client.close()
 
 
+def start_daemon_on_host(
+        host_node, project_id_list, grade_mode, grade_threshold,
+        verbose=0):
+    """Start a resident extraction daemon on host node.
+
+    See psizcollect.daemon. Unlike `update_obs_on_host`, the daemon
+    keeps running and polls for new assignments, so imports and
+    database connections are not set up again on every update. The
+    output of the daemon is written to `.psiz-collect/daemon.log`. A
+    daemon is not started if a daemon is already running on the host
+    (see psizcollect.daemon.is_running).
+
+    Arguments:
+        host_node:
+        project_id_list:
+        grade_mode:
+        grade_threshold:
+        verbose (optional):
+
+    """
+    # Connect.
+    client = paramiko.SSHClient()
+    client.load_system_host_keys()
+    client.connect(
+        host_node["ip"], port=host_node["port"], username=host_node["user"]
+    )
+
+    # Refuse to start a second daemon.
+    cmd = (
+        '{0} -c "from psizcollect import daemon; '
+        'print(daemon.is_running())"'
+    ).format(host_node["python"])
+    _, stdout, stderr = client.exec_command(cmd)
+    is_running = stdout.read().decode().strip()
+    if is_running != 'False':
+        if verbose > 0:
+            print(stderr.readlines())
+        client.close()
+        raise RuntimeError(
+            "A daemon is already running on the host or its status could "
+            "not be determined."
+        )
+
+    cmd = (
+        'nohup {0} -m psizcollect.daemon {1} --grade_mode {2} '
+        '--grade_threshold {3} > .psiz-collect/daemon.log 2>&1 &'
+    ).format(
+        host_node["python"], ' '.join(project_id_list), grade_mode,
+        grade_threshold
+    )
+    _, stdout, stderr = client.exec_command(cmd)
+    if verbose > 0:
+        print(stdout.readlines())
+        print(stderr.readlines())
+    client.close()
+
+
 def pull_obs(host_node, project_id, fp_assets, verbose=0):
     """Pull observations from host to local machine.
 
@@ -117,33 +177,77 @@ def pull_obs(host_node, project_id, fp_assets, verbose=0):
     )
     subprocess.run(cmd, shell=True)
 
+    cmd = 'scp {0}@{1}:.psiz-collect/projects/{2}/meta.hdf5 {3}/'.format(
+        host_node["user"], host_node["ip"], project_id, os.fspath(fp_obs)
+    )
+    subprocess.run(cmd, shell=True)
+
     cmd = 'scp {0}@{1}:.psiz-collect/projects/{2}/summary.txt {3}/'.format(
         host_node["user"], host_node["ip"], project_id, os.fspath(fp_obs)
     )
     subprocess.run(cmd, shell=True)
 
 
-def write_metadata(meta, fp_meta):
+def read_metadata(fp_meta):
+    """Read metadata.
+
+    Both the plain-text (meta.txt) and the columnar (meta.hdf5) format
+    are supported. Plain-text metadata is parsed using the explicit
+    dtypes of the columnar format.
+
+    Arguments:
+        fp_meta: The file path of the metadata file.
+
+    Returns:
+        meta: A pandas.DataFrame object containing the metadata.
+
+    """
+    fp_meta = Path(fp_meta)
+    if fp_meta.suffix == '.hdf5':
+        meta = pzc_store.load_meta(fp_meta.parent)
+        if meta is None:
+            raise FileNotFoundError(fp_meta)
+    else:
+        dtype = {
+            col: (object if dtype is str else dtype)
+            for col, dtype in pzc_store.META_DTYPE.items()
+        }
+        meta = pd.read_csv(fp_meta, dtype=dtype)
+    return meta
+
+
+def write_metadata(meta, fp_meta, append=False):
     """Write metadata to plain-text file.
 
     Arguments:
         meta: The metadata.
         fp_meta: The file path of the metadata file.
+        append (optional): Boolean indicating if rows should be
+            appended to an existing file.
 
     """
-    meta.to_csv(fp_meta, index=False)
+    if append and os.path.exists(fp_meta):
+        meta.to_csv(fp_meta, mode='a', header=False, index=False)
+    else:
+        meta.to_csv(fp_meta, index=False)
 
 
-def write_summary(obs, meta, fp_summary):
+def write_summary(obs, meta, fp_summary, n_stimulus=None):
     """Write a plain-text summary of the observations.
 
     Arguments:
         obs: A psiz.trials.RankObservations object.
         meta: A pandas.DataFrame object containing metadata for the
-            observations.
+            observations or the file path of a metadata file (see
+            `read_metadata`).
         fp_summary: The file path of the summary file.
+        n_stimulus (optional): The number of unique stimuli, used if
+            `obs` is None (see psizcollect.store.load_stimulus).
 
     """
+    if not isinstance(meta, pd.DataFrame):
+        meta = read_metadata(meta)
+
     f = open(fp_summary, "w")
     f.write("Summary\n")
     f.write("Last Updated: {0}\n\n".format(str(datetime.now())))
@@ -153,7 +257,7 @@ def write_summary(obs, meta, fp_summary):
     f.write(summ_assign)
 
     # Observation summary.
-    summ_obs = observation_summary(obs, meta)
+    summ_obs = observation_summary(obs, meta, n_stimulus=n_stimulus)
     f.write(summ_obs)
 
     # Protocol summary.
@@ -226,20 +330,42 @@ def assignment_summary(obs, meta):
     return msg
 
 
-def observation_summary(obs, meta):
+def observation_summary(obs, meta, n_stimulus=None):
     """Return a plain-text summary of observations.
 
     Arguments:
         obs: psiz.trials.RankObservations object.
         meta: A pandas.DataFrame object containing metadata for the
             observations.
+        n_stimulus (optional): The number of unique stimuli, used if
+            `obs` is None.
 
     Returns:
         msg: A string containing an appropriately formated summary.
 
     """
     msg = "Observations\n"
-    if obs is None:
+    locs_completed = np.logical_and(
+        np.logical_or(
+            np.equal(meta['status_code'].values, STATUS_ACCEPTED),
+            np.equal(meta['status_code'].values, STATUS_DROPPED)
+        ),
+        np.greater(meta['n_trial'].values, 0)
+    )
+    if obs is None and np.sum(locs_completed) > 0:
+        # Summarize using metadata only (e.g., streaming mode).
+        n_trial = meta['n_trial'].values[locs_completed]
+        n_agent = len(np.unique(meta['agent_id'].values[locs_completed]))
+        avg_trial_rt = np.sum(
+            meta['avg_trial_rt'].values[locs_completed] * n_trial
+        ) / np.sum(n_trial) / 1000
+        msg += "    Unique agents: {0}\n".format(n_agent)
+        msg += "    Total trials: {0}\n".format(np.sum(n_trial))
+        if n_stimulus is not None:
+            msg += "    Unique stimuli: {0}\n".format(n_stimulus)
+        msg += "    Avg. trial RT: {0:.2f} s\n".format(avg_trial_rt)
+        msg += "\n"
+    elif obs is None:
         msg += "    No observations.\n"
     else:
         n_agent = len(np.unique(obs.agent_id))
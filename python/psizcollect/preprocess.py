@@ -18,8 +18,11 @@
 Functions:
     identify_catch_trials: Identify catch trials.
     grade_catch_trials: Identify and grade catch trials.
+    score_catch_trials: Score catch trials for several grade modes.
     quality_control: Remove observations belonging to agents that do
         not meet quality control standards.
+    sweep_grade_threshold: Evaluate quality control for many grade
+        thresholds and grade modes at once.
     remove_catch_trials: Remove catch trials.
 
 """
@@ -29,6 +32,8 @@ from pathlib import Path
 import numpy as np
 import pandas as pd
 
+GRADE_MODE_LIST = ['lenient', 'strict', 'partial']
+
 
 def identify_catch_trials(obs):
     """Identify catch trials.
@@ -44,15 +49,11 @@ def identify_catch_trials(obs):
             shape = (n_trial,)
 
     """
-    n_trial = obs.n_trial
-    is_catch = np.zeros([n_trial], dtype=bool)
-    for i_trial in range(n_trial):
-        # Determine which references are identical to the query.
-        is_identical = np.equal(
-            obs.stimulus_set[i_trial, 0], obs.stimulus_set[i_trial, 1:]
-        )
-        if np.sum(is_identical) > 0:
-            is_catch[i_trial] = True
+    # Compare the query (column 0) against all references at once.
+    is_identical = np.equal(
+        obs.stimulus_set[:, 0:1], obs.stimulus_set[:, 1:]
+    )
+    is_catch = np.any(is_identical, axis=1)
     return is_catch
 
 
@@ -87,52 +88,8 @@ def grade_catch_trials(obs, grade_mode='lenient'):
             shape = (n_trial,)
 
     """
-    n_trial = obs.n_trial
-    is_catch = identify_catch_trials(obs)
-    grade = np.zeros([n_trial])
-
-    for i_trial in range(n_trial):
-        if is_catch[i_trial]:
-            # Determine which references are identical to the query.
-            is_identical = np.equal(
-                obs.stimulus_set[i_trial, 0], obs.stimulus_set[i_trial, 1:]
-            )
-            # Grade response.
-            if grade_mode == 'lenient':
-                is_identical_selected = is_identical[0:obs.n_select[i_trial]]
-                if np.sum(is_identical_selected) > 0:
-                    grade[i_trial] = 1
-            elif grade_mode == 'strict':
-                if obs.is_ranked[i_trial]:
-                    is_identical_selected = is_identical[0]
-                else:
-                    is_identical_selected = is_identical[
-                        0:obs.n_select[i_trial]
-                    ]
-                if np.sum(is_identical_selected) > 0:
-                    grade[i_trial] = 1
-            elif grade_mode == 'partial':
-                if obs.is_ranked[i_trial]:
-                    is_identical_selected = is_identical[0]
-                    if is_identical_selected:
-                        grade[i_trial] = 1
-                    else:
-                        is_identical_selected = is_identical[
-                            0:obs.n_select[i_trial]
-                        ]
-                        if np.sum(is_identical_selected) > 0:
-                            grade[i_trial] = .5
-                else:
-                    is_identical_selected = is_identical[
-                        0:obs.n_select[i_trial]
-                    ]
-                    if np.sum(is_identical_selected) > 0:
-                        grade[i_trial] = 1
-            else:
-                raise ValueError((
-                    "The argument `grade_mode` must be 'strict', 'partial' or"
-                    " 'lenient'."
-                ))
+    (is_catch, score) = score_catch_trials(obs, grade_mode_list=[grade_mode])
+    grade = score[grade_mode]
 
     # Compute average grade.
     grade = grade[is_catch]
@@ -145,6 +102,79 @@ def grade_catch_trials(obs, grade_mode='lenient'):
     return (avg_grade, grade, is_catch)
 
 
+def score_catch_trials(obs, grade_mode_list=None):
+    """Score catch trials for several grade modes.
+
+    The comparison of the query with the references is computed once
+    and shared by all grade modes. See `grade_catch_trials` for the
+    grade modes.
+
+    Arguments:
+        obs: A psiz.trials.RankObservations object.
+        grade_mode_list (optional): A list of grade modes. By default,
+            all grade modes are scored.
+
+    Returns:
+        is_catch: Boolean array indicating catch trial locations.
+            shape = (n_trial,)
+        score: A dictionary mapping each grade mode to an array
+            indicating the grade of every trial. Trials that are not
+            catch trials have a grade of zero.
+            shape = (n_trial,)
+
+    """
+    if grade_mode_list is None:
+        grade_mode_list = GRADE_MODE_LIST
+    for grade_mode in grade_mode_list:
+        if grade_mode not in GRADE_MODE_LIST:
+            raise ValueError((
+                "The argument `grade_mode` must be 'strict', 'partial' or"
+                " 'lenient'."
+            ))
+
+    # Determine which references are identical to the query.
+    is_identical = np.equal(
+        obs.stimulus_set[:, 0:1], obs.stimulus_set[:, 1:]
+    )
+    is_catch = np.any(is_identical, axis=1)
+
+    # Mask of selected reference positions.
+    is_selected = np.less(
+        np.arange(is_identical.shape[1])[np.newaxis, :],
+        obs.n_select[:, np.newaxis]
+    )
+    is_identical_selected = np.any(
+        np.logical_and(is_identical, is_selected), axis=1
+    )
+    is_identical_first = is_identical[:, 0]
+    is_ranked = obs.is_ranked.astype(bool)
+
+    # Grade response.
+    score = {}
+    for grade_mode in grade_mode_list:
+        grade = is_identical_selected.astype(float)
+        if grade_mode == 'strict':
+            grade[is_ranked] = is_identical_first[is_ranked]
+        elif grade_mode == 'partial':
+            grade[is_ranked] = np.where(
+                is_identical_first[is_ranked], 1., .5 * grade[is_ranked]
+            )
+        score[grade_mode] = grade
+    return (is_catch, score)
+
+
+def _agent_grade(agent_idx, n_agent, is_catch, grade):
+    """Return the average catch trial grade of every agent."""
+    n_catch = np.bincount(agent_idx[is_catch], minlength=n_agent)
+    score = np.bincount(
+        agent_idx[is_catch], weights=grade[is_catch], minlength=n_agent
+    )
+    agent_grade = np.full([n_agent], np.nan)
+    locs_catch = n_catch > 0
+    agent_grade[locs_catch] = score[locs_catch] / n_catch[locs_catch]
+    return agent_grade
+
+
 def quality_control(obs, grade_thresh=1.0, grade_mode='lenient'):
     """Remove agents that do not meet quality control standards.
 
@@ -159,33 +189,117 @@ def quality_control(obs, grade_thresh=1.0, grade_mode='lenient'):
         obs: An psiz.trials.RankObservations object with bad data removed.
 
     """
-    agent_list = np.unique(obs.agent_id)
+    (agent_list, agent_idx) = np.unique(obs.agent_id, return_inverse=True)
+    n_agent = len(agent_list)
+
+    # Grade all catch trials once and reduce per agent.
+    (is_catch, score) = score_catch_trials(obs, grade_mode_list=[grade_mode])
+    grade = _agent_grade(agent_idx, n_agent, is_catch, score[grade_mode])
+
+    # Drop agent if below required grade threshold.
+    # Note that this retains observations with zero catch trials.
+    is_retained = np.logical_not(grade < grade_thresh)
     grade_record = {
         'agent_id': agent_list,
-        'grade': np.zeros(len(agent_list)),
-        'is_retained': np.ones(len(agent_list), dtype=bool)
+        'grade': grade,
+        'is_retained': is_retained
     }
-
-    keep_locs = np.ones([obs.n_trial], dtype=bool)
-    for idx, i_agent in enumerate(agent_list):
-        agent_locs = np.equal(obs.agent_id, i_agent)
-        obs_agent = obs.subset(agent_locs)
-        (avg_grade, _, _) = grade_catch_trials(
-            obs_agent, grade_mode=grade_mode
-        )
-        grade_record['grade'][idx] = avg_grade
-
-        # Drop agent if below required grade threshold.
-        # Note that this retains observations with zero catch trials.
-        if avg_grade < grade_thresh:
-            keep_locs[agent_locs] = False
-            grade_record['is_retained'][idx] = False
+    keep_locs = is_retained[agent_idx]
 
     obs_new = obs.subset(keep_locs)
     df_grade = pd.DataFrame.from_dict(grade_record)
     return obs_new, df_grade
 
 
+def sweep_grade_threshold(
+        obs, grade_thresh_list, grade_mode_list=None, return_mask=True):
+    """Evaluate quality control for many grade thresholds at once.
+
+    The per-agent grades are computed once for every grade mode (see
+    `score_catch_trials`). Each combination of grade mode and grade
+    threshold then only requires a comparison, yielding the same
+    retained agents and observations as calling `quality_control`
+    with that combination.
+
+    Arguments:
+        obs: A psiz.trials.RankObservations object.
+        grade_thresh_list: A list of grade thresholds.
+        grade_mode_list (optional): A list of grade modes. By default,
+            all grade modes are evaluated.
+        return_mask (optional): Boolean indicating if the observation
+            masks should be returned.
+
+    Returns:
+        df_sweep: A pandas.DataFrame object with one row per grade
+            mode and grade threshold, containing the number of
+            retained agents (`n_agent_retained`) and retained trials
+            (`n_trial_retained`).
+        df_grade: A pandas.DataFrame object with one row per agent,
+            containing the number of trials (`n_trial`) and catch
+            trials (`n_catch`) and the grade of every grade mode
+            (`grade_<grade_mode>`).
+        is_retained: A dictionary mapping each grade mode to a
+            Boolean array indicating the retained agents (in the order
+            of `df_grade`).
+            shape = (n_thresh, n_agent)
+        keep_locs: A dictionary mapping each grade mode to a Boolean
+            array indicating the retained observations, or None if
+            `return_mask=False`.
+            shape = (n_thresh, n_trial)
+
+    """
+    if grade_mode_list is None:
+        grade_mode_list = GRADE_MODE_LIST
+    grade_thresh_list = np.asarray(grade_thresh_list, dtype=float)
+
+    (agent_list, agent_idx) = np.unique(obs.agent_id, return_inverse=True)
+    n_agent = len(agent_list)
+    (is_catch, score) = score_catch_trials(
+        obs, grade_mode_list=grade_mode_list
+    )
+    n_trial_agent = np.bincount(agent_idx, minlength=n_agent)
+    grade_record = {
+        'agent_id': agent_list,
+        'n_trial': n_trial_agent,
+        'n_catch': np.bincount(agent_idx[is_catch], minlength=n_agent)
+    }
+
+    sweep_record = {
+        'grade_mode': [],
+        'grade_thresh': [],
+        'n_agent_retained': [],
+        'n_trial_retained': []
+    }
+    is_retained = {}
+    keep_locs = None
+    if return_mask:
+        keep_locs = {}
+    for grade_mode in grade_mode_list:
+        grade = _agent_grade(agent_idx, n_agent, is_catch, score[grade_mode])
+        grade_record['grade_{0}'.format(grade_mode)] = grade
+
+        # Note that this retains agents with zero catch trials.
+        is_retained[grade_mode] = np.logical_not(
+            grade[np.newaxis, :] < grade_thresh_list[:, np.newaxis]
+        )
+        sweep_record['grade_mode'].extend(
+            [grade_mode] * len(grade_thresh_list)
+        )
+        sweep_record['grade_thresh'].extend(grade_thresh_list)
+        sweep_record['n_agent_retained'].extend(
+            np.sum(is_retained[grade_mode], axis=1)
+        )
+        sweep_record['n_trial_retained'].extend(
+            np.dot(is_retained[grade_mode], n_trial_agent)
+        )
+        if return_mask:
+            keep_locs[grade_mode] = is_retained[grade_mode][:, agent_idx]
+
+    df_sweep = pd.DataFrame.from_dict(sweep_record)
+    df_grade = pd.DataFrame.from_dict(grade_record)
+    return df_sweep, df_grade, is_retained, keep_locs
+
+
 def remove_catch_trials(obs):
     """Remove all catch trials.
 
@@ -0,0 +1,515 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 The PsiZ Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Module for storing observations and metadata of a project.
+
+Observations are stored in a single file inside a project directory:
+
+```
+<project_id>/
++-- obs_dirty.hdf5
++-- obs_stimulus.json
+```
+
+The file `obs_dirty.hdf5` has the layout of
+`psiz.trials.RankObservations.save`, so it can be loaded with
+`psiz.trials.load_trials`. Every per-trial dataset is chunked and
+resizable. An append writes the new trials in place at the end of
+each dataset and then updates the number of stored trials (the file
+attribute `n_trial_commit`), so the cost of an append only depends on
+the number of new trials. Trials beyond `n_trial_commit` are ignored
+by `load_obs`.
+
+Appends can also be staged, i.e., written without updating
+`n_trial_commit`. Staged trials are then committed together (see
+`commit_obs`) or discarded (see `rollback_obs`), for example once the
+metadata that refers to them has been saved or has failed to save.
+Committed trials that are not yet known to be referenced by metadata
+lie beyond the file attribute `n_trial_sync` until they are
+checkpointed (see `checkpoint_obs`). After an interruption, such
+trials are trimmed to the sessions that the metadata does refer to
+(see `reconcile_obs`).
+
+The unique stimulus indices of the stored observations are kept up to
+date in `obs_stimulus.json`, so that they can be summarized without
+loading the observations.
+
+Metadata can optionally be stored in a binary columnar format,
+`meta.hdf5`, with one resizable dataset per column and explicit
+dtypes (see `META_DTYPE`). New rows are appended in place, avoiding
+the text parsing and type inference of `meta.txt`.
+
+Functions:
+    load_obs: Load the stored observations.
+    append_obs: Append observations in place.
+    commit_obs: Commit staged observations.
+    rollback_obs: Discard staged observations.
+    checkpoint_obs: Mark committed observations as referenced by
+        metadata.
+    reconcile_obs: Trim unreferenced committed observations.
+    save_obs: Replace all stored observations.
+    clear_obs: Remove all stored observations.
+    load_stimulus: Load the unique stimulus indices of the stored
+        observations.
+    load_meta: Load columnar metadata.
+    save_meta: Save columnar metadata.
+    append_meta: Append rows to columnar metadata.
+
+"""
+
+import json
+import os
+from pathlib import Path
+
+import h5py
+import numpy as np
+import pandas as pd
+import psiz.trials
+
+FN_OBS = 'obs_dirty.hdf5'
+FN_STIMULUS = 'obs_stimulus.json'
+FN_META = 'meta.hdf5'
+# File attribute holding the number of committed trials.
+ATTR_N_TRIAL = 'n_trial_commit'
+# File attribute holding the number of committed trials that are
+# referenced by metadata.
+ATTR_N_SYNC = 'n_trial_sync'
+# File attribute listing the per-trial datasets.
+ATTR_TRIAL_KEY = 'trial_key'
+
+# Explicit dtypes of known metadata columns. Columns that are not
+# listed use the dtype of the supplied pandas.DataFrame.
+META_DTYPE = {
+    'assignment_id': np.int64,
+    'worker_id': str,
+    'agent_id': np.int64,
+    'session_id': np.int64,
+    'session_count': np.int64,
+    'protocol_id': str,
+    'status_code': np.int64,
+    'duration_hit_min': np.float64,
+    'avg_trial_rt': np.float64,
+    'n_trial': np.int64,
+    'n_catch': np.int64,
+    'grade': np.float64,
+    'is_accepted': np.bool_,
+    'grade_lenient': np.float64,
+    'grade_strict': np.float64,
+    'grade_partial': np.float64
+}
+
+
+def load_obs(fp_project):
+    """Load the stored observations.
+
+    Arguments:
+        fp_project: The project directory.
+
+    Returns:
+        obs: A psiz.trials.RankObservations object or None if no
+            observations exist.
+
+    """
+    fp_obs = Path(fp_project, FN_OBS)
+    if not os.path.exists(fp_obs):
+        return None
+
+    n_trial = _n_trial_commit(fp_obs)
+    if n_trial == 0:
+        return None
+    obs = psiz.trials.load_trials(fp_obs)
+    if obs.n_trial > n_trial:
+        # Ignore staged trials.
+        obs = obs.subset(np.arange(n_trial))
+    return obs
+
+
+def append_obs(fp_project, obs, stage=False):
+    """Append observations in place.
+
+    If no observations are stored, they are created.
+
+    Arguments:
+        fp_project: The project directory.
+        obs: A psiz.trials.RankObservations object.
+        stage (optional): Boolean indicating if the observations
+            should be staged instead of committed. Staged observations
+            are appended after any previously staged observations.
+            Otherwise, previously staged observations are discarded.
+
+    Returns:
+        fp_obs: The file path of the stored observations.
+
+    """
+    fp_obs = Path(fp_project, FN_OBS)
+    if os.path.exists(fp_obs) and not _is_appendable(fp_obs):
+        # Convert observations saved by `RankObservations.save`.
+        _write_obs_file(fp_obs, fp_obs)
+
+    fp_tmp = Path(fp_project, FN_OBS + '.tmp')
+    obs.save(fp_tmp)
+    try:
+        if not os.path.exists(fp_obs):
+            _write_obs_file(fp_tmp, fp_obs, is_commit=False)
+        else:
+            with h5py.File(fp_obs, 'a') as f:
+                if stage:
+                    idx_start = _n_trial_stored(f)
+                else:
+                    idx_start = int(f.attrs[ATTR_N_TRIAL])
+                with h5py.File(fp_tmp, 'r') as f_src:
+                    _append_trial(f_src, f, idx_start, obs.n_trial)
+    finally:
+        os.remove(fp_tmp)
+    if not stage:
+        commit_obs(fp_project)
+    return fp_obs
+
+
+def commit_obs(fp_project):
+    """Commit staged observations.
+
+    Arguments:
+        fp_project: The project directory.
+
+    """
+    fp_obs = Path(fp_project, FN_OBS)
+    if not os.path.exists(fp_obs) or not _is_appendable(fp_obs):
+        return
+
+    with h5py.File(fp_obs, 'a') as f:
+        n_trial_pre = int(f.attrs[ATTR_N_TRIAL])
+        n_trial = _n_trial_stored(f)
+        if n_trial == n_trial_pre:
+            return
+        stimulus_set = f['stimulus_set'][n_trial_pre:n_trial]
+        f.attrs[ATTR_N_TRIAL] = n_trial
+    _update_stimulus(fp_project, stimulus_set)
+
+
+def rollback_obs(fp_project):
+    """Discard staged observations.
+
+    Arguments:
+        fp_project: The project directory.
+
+    """
+    fp_obs = Path(fp_project, FN_OBS)
+    if not os.path.exists(fp_obs) or not _is_appendable(fp_obs):
+        return
+
+    with h5py.File(fp_obs, 'a') as f:
+        n_trial = int(f.attrs[ATTR_N_TRIAL])
+        for key in f.attrs[ATTR_TRIAL_KEY]:
+            if f[key].shape[0] > n_trial:
+                f[key].resize(n_trial, axis=0)
+
+
+def checkpoint_obs(fp_project):
+    """Mark committed observations as referenced by metadata.
+
+    Arguments:
+        fp_project: The project directory.
+
+    """
+    fp_obs = Path(fp_project, FN_OBS)
+    if not os.path.exists(fp_obs) or not _is_appendable(fp_obs):
+        return
+
+    with h5py.File(fp_obs, 'a') as f:
+        f.attrs[ATTR_N_SYNC] = int(f.attrs[ATTR_N_TRIAL])
+
+
+def reconcile_obs(fp_project, session_id):
+    """Trim unreferenced committed observations.
+
+    Committed trials beyond the last checkpoint whose session is not
+    in `session_id` are removed and the remaining trials are
+    checkpointed. Staged trials are discarded.
+
+    Arguments:
+        fp_project: The project directory.
+        session_id: An array of the session IDs referenced by
+            metadata.
+
+    Returns:
+        n_trial_drop: The number of removed trials.
+
+    """
+    fp_obs = Path(fp_project, FN_OBS)
+    if not os.path.exists(fp_obs) or not _is_appendable(fp_obs):
+        return 0
+
+    n_trial_drop = 0
+    with h5py.File(fp_obs, 'a') as f:
+        n_trial = int(f.attrs[ATTR_N_TRIAL])
+        n_sync = int(f.attrs.get(ATTR_N_SYNC, n_trial))
+        if n_trial > n_sync:
+            is_keep = np.isin(f['session_id'][n_sync:n_trial], session_id)
+            n_trial_drop = int(np.sum(np.logical_not(is_keep)))
+        for key in f.attrs[ATTR_TRIAL_KEY]:
+            dset = f[key]
+            if n_trial_drop > 0:
+                values = dset[n_sync:n_trial][is_keep]
+                dset[n_sync:n_sync + len(values)] = values
+            dset.resize(n_trial - n_trial_drop, axis=0)
+        f.attrs[ATTR_N_TRIAL] = n_trial - n_trial_drop
+        f.attrs[ATTR_N_SYNC] = n_trial - n_trial_drop
+    fp_stimulus = Path(fp_project, FN_STIMULUS)
+    if n_trial_drop > 0 and os.path.exists(fp_stimulus):
+        # Derive the unique stimuli of the remaining trials anew.
+        os.remove(fp_stimulus)
+    return n_trial_drop
+
+
+def save_obs(fp_project, obs):
+    """Replace all stored observations.
+
+    Arguments:
+        fp_project: The project directory.
+        obs: A psiz.trials.RankObservations object.
+
+    """
+    fp_obs = Path(fp_project, FN_OBS)
+    fp_tmp = Path(fp_project, FN_OBS + '.tmp')
+    obs.save(fp_tmp)
+    try:
+        _write_obs_file(fp_tmp, fp_obs)
+    finally:
+        os.remove(fp_tmp)
+    _save_stimulus(fp_project, np.unique(obs.stimulus_set))
+
+
+def clear_obs(fp_project):
+    """Remove all stored observations.
+
+    Arguments:
+        fp_project: The project directory.
+
+    """
+    for fn in [FN_OBS, FN_STIMULUS]:
+        fp = Path(fp_project, fn)
+        if os.path.exists(fp):
+            os.remove(fp)
+
+
+def load_stimulus(fp_project):
+    """Load the unique stimulus indices of the stored observations.
+
+    Arguments:
+        fp_project: The project directory.
+
+    Returns:
+        stimulus_id: A sorted array of the unique values of the
+            stimulus set (including the placeholder -1) or None if no
+            observations exist.
+
+    """
+    fp_obs = Path(fp_project, FN_OBS)
+    fp_stimulus = Path(fp_project, FN_STIMULUS)
+    if not os.path.exists(fp_obs):
+        return None
+    if not os.path.exists(fp_stimulus):
+        # Derive the index from the stored stimulus set.
+        n_trial = _n_trial_commit(fp_obs)
+        with h5py.File(fp_obs, 'r') as f:
+            stimulus_set = f['stimulus_set'][0:n_trial]
+        _save_stimulus(fp_project, np.unique(stimulus_set))
+
+    with open(fp_stimulus, 'r') as f:
+        stimulus_id = np.array(json.load(f)['stimulus_id'], dtype=int)
+    return stimulus_id
+
+
+def _is_appendable(fp_obs):
+    """Return True if observations were written by the store."""
+    with h5py.File(fp_obs, 'r') as f:
+        return ATTR_N_TRIAL in f.attrs
+
+
+def _n_trial_commit(fp_obs):
+    """Return the number of committed trials."""
+    with h5py.File(fp_obs, 'r') as f:
+        if ATTR_N_TRIAL in f.attrs:
+            n_trial = int(f.attrs[ATTR_N_TRIAL])
+        else:
+            n_trial = f['stimulus_set'].shape[0]
+    return n_trial
+
+
+def _n_trial_stored(f):
+    """Return the number of stored trials, including staged trials."""
+    return f['stimulus_set'].shape[0]
+
+
+def _write_obs_file(fp_src, fp_obs, is_commit=True):
+    """Write observations with chunked, resizable per-trial datasets.
+
+    Datasets with one entry per trial are made resizable, all other
+    datasets (e.g., `trial_type`) are copied as-is. If `is_commit` is
+    False, the trials are written as staged trials.
+
+    """
+    fp_new = Path(str(fp_obs) + '.new')
+    n_trial = _n_trial_commit(fp_src)
+    with h5py.File(fp_src, 'r') as f_src, h5py.File(fp_new, 'w') as f:
+        trial_key = []
+        for key in f_src.keys():
+            dset = f_src[key]
+            if dset.ndim > 0 and dset.shape[0] == n_trial:
+                # Unused columns of the stimulus set are filled with
+                # the placeholder -1.
+                fillvalue = -1 if dset.ndim == 2 else None
+                f.create_dataset(
+                    key, data=dset[0:n_trial],
+                    maxshape=(None,) * dset.ndim, chunks=True,
+                    fillvalue=fillvalue
+                )
+                trial_key.append(key)
+            else:
+                f_src.copy(key, f)
+        f.attrs[ATTR_TRIAL_KEY] = trial_key
+        f.attrs[ATTR_N_TRIAL] = n_trial if is_commit else 0
+        f.attrs[ATTR_N_SYNC] = f.attrs[ATTR_N_TRIAL]
+    os.replace(fp_new, fp_obs)
+
+
+def _append_trial(f_src, f, idx_start, n_trial):
+    """Write the per-trial datasets of `f_src` at `idx_start`."""
+    for key in f.attrs[ATTR_TRIAL_KEY]:
+        if key not in f_src:
+            raise ValueError(
+                "The observations do not match the stored observations."
+            )
+        dset = f[key]
+        values = f_src[key][()]
+        if dset.ndim == 2 and values.shape[1] != dset.shape[1]:
+            # Pad the narrower stimulus set with the placeholder -1.
+            n_col = max(values.shape[1], dset.shape[1])
+            dset.resize(n_col, axis=1)
+            values_pad = -1 * np.ones([n_trial, n_col], dtype=values.dtype)
+            values_pad[:, 0:values.shape[1]] = values
+            values = values_pad
+        dset.resize(idx_start + n_trial, axis=0)
+        dset[idx_start:] = values
+
+
+def _update_stimulus(fp_project, stimulus_set):
+    """Add the stimuli of `stimulus_set` to the unique stimuli."""
+    stimulus_id = load_stimulus(fp_project)
+    if stimulus_id is None:
+        stimulus_id = np.array([], dtype=int)
+    _save_stimulus(
+        fp_project, np.union1d(stimulus_id, np.unique(stimulus_set))
+    )
+
+
+def _save_stimulus(fp_project, stimulus_id):
+    """Atomically save the unique stimulus indices."""
+    fp_stimulus = Path(fp_project, FN_STIMULUS)
+    fp_tmp = Path(fp_project, FN_STIMULUS + '.tmp')
+    with open(fp_tmp, 'w') as f:
+        json.dump({'stimulus_id': [int(i) for i in stimulus_id]}, f)
+    os.replace(fp_tmp, fp_stimulus)
+
+
+def load_meta(fp_project):
+    """Load columnar metadata.
+
+    Arguments:
+        fp_project: The project directory.
+
+    Returns:
+        meta: A pandas.DataFrame object or None if columnar metadata
+            does not exist.
+
+    """
+    fp_meta = Path(fp_project, FN_META)
+    if not os.path.exists(fp_meta):
+        return None
+
+    dict_meta = {}
+    with h5py.File(fp_meta, 'r') as f:
+        for col in f.attrs['columns']:
+            dset = f[col]
+            if h5py.check_string_dtype(dset.dtype) is not None:
+                dict_meta[col] = dset.asstr()[()].astype(object)
+            else:
+                dict_meta[col] = dset[()]
+    meta = pd.DataFrame.from_dict(dict_meta)
+    return meta
+
+
+def save_meta(fp_project, meta):
+    """Save columnar metadata, replacing any existing metadata.
+
+    Arguments:
+        fp_project: The project directory.
+        meta: A pandas.DataFrame object.
+
+    """
+    fp_meta = Path(fp_project, FN_META)
+    fp_tmp = Path(fp_project, FN_META + '.tmp')
+    with h5py.File(fp_tmp, 'w') as f:
+        f.attrs['columns'] = list(meta.columns)
+        for col in meta.columns:
+            values = _meta_column(meta, col)
+            f.create_dataset(
+                col, data=values, maxshape=(None,), chunks=True
+            )
+    os.replace(fp_tmp, fp_meta)
+
+
+def append_meta(fp_project, meta):
+    """Append rows to columnar metadata.
+
+    If columnar metadata does not exist, it is created.
+
+    Arguments:
+        fp_project: The project directory.
+        meta: A pandas.DataFrame object with the same columns as the
+            existing metadata.
+
+    """
+    fp_meta = Path(fp_project, FN_META)
+    if not os.path.exists(fp_meta):
+        save_meta(fp_project, meta)
+        return
+
+    with h5py.File(fp_meta, 'a') as f:
+        columns = list(f.attrs['columns'])
+        if columns != list(meta.columns):
+            raise ValueError(
+                "The columns of `meta` do not match the stored metadata."
+            )
+        n_row = len(meta.index)
+        for col in columns:
+            dset = f[col]
+            n_row_pre = dset.shape[0]
+            dset.resize((n_row_pre + n_row,))
+            dset[n_row_pre:] = _meta_column(meta, col)
+
+
+def _meta_column(meta, col):
+    """Return metadata column with explicit dtype."""
+    dtype = META_DTYPE.get(col, meta[col].dtype)
+    if dtype is str or dtype == object:
+        values = np.array(
+            [str(v) for v in meta[col].values], dtype=h5py.string_dtype()
+        )
+    else:
+        values = meta[col].values.astype(dtype)
+    return values
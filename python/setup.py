@@ -15,7 +15,7 @@ setup(
     packages=['psizcollect'],
     install_requires=[
         'numpy', 'pandas', 'paramiko', 'mysql-connector-python', 'psiz>=0.2.1',
-        'boto3'
+        'boto3', 'h5py'
     ],
     include_package_data=True,
 )